@@ -3,13 +3,28 @@ import sys
 import asyncio
 import re
 import shutil
+import errno
 import subprocess
 import json
 import random
 import importlib.util
 import io
 import urllib.parse
-from contextlib import redirect_stdout
+import uuid
+import time
+import http.cookiejar
+import concurrent.futures
+import sqlite3
+import threading
+import contextvars
+import ast
+import atexit
+import tempfile
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+
+import m3u8_parser
 
 # Dependency Check
 try:
@@ -90,9 +105,420 @@ def setup_interface(config_data=None, log_cb=None, input_cb=None, status_cb=None
     if status_cb: STATUS_CALLBACK = status_cb
     if stop_cb: STOP_CALLBACK = stop_cb
 
-def log(msg, end="\n"):
-    if LOG_CALLBACK: LOG_CALLBACK(str(msg) + end)
+# Log levels ('success', 'error', 'warning', 'info' or None) come from the caller;
+# lines that don't pass one are classified by their leading icon.
+LOG_LEVEL_ICONS = (("✅", "success"), ("💾", "success"), ("❌", "error"), ("⚠️", "warning"),
+                   ("🔍", "info"), ("🕵️", "info"), ("⚡", "info"), ("📝", "info"))
+
+def log_level(msg):
+    text = str(msg).lstrip()
+    for icon, level in LOG_LEVEL_ICONS:
+        if text.startswith(icon):
+            return level
+    return None
+
+def log(msg, end="\n", level=None, event="message", **fields):
+    """
+    Logs one line. The emoji text goes to the GUI callback or the console;
+    structured sinks (see log_event) get it as a record with level, job, phase
+    and any extra fields (url=..., bytes=...).
+    """
+    level = level or log_level(msg)
+    if LOG_CALLBACK: LOG_CALLBACK(str(msg) + end, level)
     else: print(msg, end=end)
+    if LOG_SINKS or CONFIG.get('log_json'):
+        text = str(msg).strip()
+        if text.strip("="):
+            emit_record(event, level, msg=text, **fields)
+
+# --- STRUCTURED LOGGING ---
+# Every log line and event can also be delivered as a record:
+#   {"ts", "level", "event", "job", "phase", "elapsed_ms", "msg", ...fields}
+# The job and phase follow the running task through contextvars, so concurrent
+# captures and downloads keep their records apart without passing ids around.
+LOG_JOB = contextvars.ContextVar('log_job', default=None)
+LOG_PHASE = contextvars.ContextVar('log_phase', default=None)
+# Extra record consumers: callables taking the record dict (see add_log_sink)
+LOG_SINKS = []
+
+def add_log_sink(sink):
+    if sink not in LOG_SINKS:
+        LOG_SINKS.append(sink)
+
+def remove_log_sink(sink):
+    if sink in LOG_SINKS:
+        LOG_SINKS.remove(sink)
+
+class JsonLinesSink:
+    """Appends one JSON object per record to a file, flushed per line so it can be tailed."""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+JSON_SINK = None
+
+def get_json_sink():
+    """The sink for CONFIG['log_json'] (a path, relative to the script folder), or None."""
+    global JSON_SINK
+    path = CONFIG.get('log_json')
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(get_base_dir(), path)
+    if JSON_SINK is None or JSON_SINK.path != path:
+        if JSON_SINK is not None:
+            JSON_SINK.close()
+        try:
+            JSON_SINK = JsonLinesSink(path)
+        except OSError as e:
+            CONFIG['log_json'] = ""
+            log(f"⚠️ Could not open JSON log {path}: {e}")
+            return None
+    return JSON_SINK
+
+def emit_record(event, level=None, **fields):
+    record = {'ts': round(time.time(), 3), 'level': level or 'info', 'event': event}
+    job = LOG_JOB.get()
+    if job:
+        record['job'] = job['id']
+        record['elapsed_ms'] = int((time.monotonic() - job['start']) * 1000)
+    phase = LOG_PHASE.get()
+    if phase:
+        record['phase'] = phase
+    record.update(fields)
+    sink = get_json_sink()
+    for target in ([sink] if sink else []) + LOG_SINKS:
+        try:
+            target(record)
+        except Exception:
+            pass
+
+def log_event(event, level=None, **fields):
+    """A structured-only event (no console/GUI text), e.g. log_event('download.end', bytes=...)."""
+    if LOG_SINKS or CONFIG.get('log_json'):
+        emit_record(event, level, **fields)
+
+# Phases in the order an item goes through them (spans inside them are listed after)
+JOB_PHASES = ('capture', 'download', 'remux', 'plugins', 'move')
+# Collects finished jobs for the queue run in progress (see RunReport)
+RUN_REPORT = contextvars.ContextVar('run_report', default=None)
+
+def begin_job(url):
+    """Starts a job context for one queue item; records logged from this task carry its id."""
+    # Bucket by the embed host the browser opens (IMDB links become vsembed)
+    host = urllib.parse.urlparse(to_embed_url(url)).hostname or ""
+    job = {'id': uuid.uuid4().hex[:8], 'start': time.monotonic(), 'host': host,
+           'spans': {}, 'phase': None, 'phase_start': None, 'report': RUN_REPORT.get()}
+    LOG_JOB.set(job)
+    LOG_PHASE.set(None)
+    log_event('job.start', url=url)
+    return job
+
+def resume_job(job):
+    """Continues a job in another task (e.g. a download worker picking up a capture)."""
+    LOG_JOB.set(job)
+    LOG_PHASE.set(None)
+
+def record_span(name, seconds):
+    """Adds 'seconds' to the current job's span 'name' (repeated spans add up)."""
+    job = LOG_JOB.get()
+    if job is not None and seconds >= 0:
+        job['spans'][name] = job['spans'].get(name, 0) + seconds
+        METRICS.observe_span(name, seconds)
+
+@contextmanager
+def span(name):
+    """Times the enclosed block as span 'name' of the current job: with span('verify'): ..."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record_span(name, time.monotonic() - start)
+
+def end_phase():
+    """Closes the current phase span (time spent waiting between phases isn't counted)."""
+    job = LOG_JOB.get()
+    if job is not None and job['phase']:
+        record_span(job['phase'], time.monotonic() - job['phase_start'])
+        job['phase'] = None
+
+def set_phase(phase):
+    job = LOG_JOB.get()
+    if job is not None:
+        end_phase()
+        job['phase'], job['phase_start'] = phase, time.monotonic()
+    LOG_PHASE.set(phase)
+    log_event('phase.start')
+
+def format_spans(spans):
+    """'capture 12.3s · download 5m 01s | browser 0.4s, goto 1.2s' (phases first, then the rest)."""
+    def fmt(seconds):
+        return f"{int(seconds // 60)}m {int(seconds % 60):02d}s" if seconds >= 60 else f"{seconds:.1f}s"
+    phases = [f"{name} {fmt(spans[name])}" for name in JOB_PHASES if name in spans]
+    others = [f"{name} {fmt(value)}" for name, value in spans.items() if name not in JOB_PHASES]
+    return " · ".join(phases) + (" | " + ", ".join(others) if others else "")
+
+def finish_job(result):
+    """Records how the current job ended (True, False, "404" or an exception) and its timing spans."""
+    end_phase()
+    job = LOG_JOB.get()
+    spans = job['spans'] if job else {}
+    if isinstance(result, Exception):
+        outcome, level = 'error', 'error'
+    elif result is True:
+        outcome, level = 'ok', 'success'
+    else:
+        outcome, level = ('404' if result == "404" else 'failed'), 'error'
+    fields = {'result': outcome, 'spans': {name: int(value * 1000) for name, value in spans.items()}}
+    if isinstance(result, Exception):
+        fields['error'] = str(result)[:200]
+    log_event('job.end', level, **fields)
+    if spans:
+        log(f"⏱️  {format_spans(spans)}")
+    if job and job['report'] is not None:
+        job['report'].add(job['host'], outcome, spans, time.monotonic() - job['start'])
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = -(-p * len(ordered) // 100)
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+class RunReport:
+    """
+    Aggregates the timing spans of every item in a queue run:
+    p50/p95 per span overall and per embed host, written to run_report.json
+    (config 'run_report'; empty disables) and summarised in the log.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.items = []
+
+    def add(self, host, result, spans, total):
+        self.items.append({'host': host, 'result': result, 'spans': dict(spans), 'total': total})
+
+    @staticmethod
+    def stats(items):
+        by_span = {}
+        for item in items:
+            for name, value in list(item['spans'].items()) + [('total', item['total'])]:
+                by_span.setdefault(name, []).append(value)
+        order = list(JOB_PHASES) + sorted(n for n in by_span if n not in JOB_PHASES and n != 'total') + ['total']
+        return {name: {'count': len(by_span[name]),
+                       'p50_ms': int(percentile(by_span[name], 50) * 1000),
+                       'p95_ms': int(percentile(by_span[name], 95) * 1000)}
+                for name in order if name in by_span}
+
+    def summary(self):
+        results = {}
+        for item in self.items:
+            results[item['result']] = results.get(item['result'], 0) + 1
+        hosts = sorted({item['host'] for item in self.items})
+        return {
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'duration_s': round(time.time() - self.started, 1),
+            'items': len(self.items),
+            'results': results,
+            'phases': self.stats(self.items),
+            'hosts': {host: self.stats([i for i in self.items if i['host'] == host]) for host in hosts},
+        }
+
+    def write(self):
+        if not self.items:
+            return
+        summary = self.summary()
+        log(f"\n⏱️  Timing report ({summary['items']} items): p50 / p95")
+        for name, stat in summary['phases'].items():
+            log(f"   {name:<12} {stat['p50_ms'] / 1000:>8.1f}s {stat['p95_ms'] / 1000:>8.1f}s  ({stat['count']})")
+        path = CONFIG.get('run_report', 'run_report.json')
+        if not path:
+            return
+        if not os.path.isabs(path):
+            path = os.path.join(get_base_dir(), path)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            log(f"   Saved to {path}")
+        except OSError as e:
+            log(f"   ⚠️ Could not save the timing report: {e}")
+
+def current_job_key():
+    job = LOG_JOB.get()
+    return job['id'] if job else None
+
+def note_skipped(url, reason):
+    """Called by the queue loops for items they skip (already completed, file exists...)."""
+    METRICS.item_skipped()
+    log_event('item.skipped', url=url, reason=reason)
+
+class Metrics:
+    """
+    Counters and gauges for long queue runs, exported in Prometheus text format
+    (see start_metrics):
+    - Item outcomes, bytes and download time come from the structured log records (job.end, download.end).
+    - Current speed, captures in flight, 429s, browser launches and span timings are
+      updated directly by the download engines, the hunt and the browser pool.
+    """
+    RESULTS = ('ok', 'failed', '404', 'error', 'skipped')
+    # A download that hasn't reported its speed for this long no longer counts as current
+    SPEED_STALE_AFTER = 15
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.items = dict.fromkeys(self.RESULTS, 0)
+        self.bytes_total = 0
+        self.download_seconds = 0.0
+        self.captures_in_flight = 0
+        self.speeds = {}
+        self.spans = {}
+        self.throttled = 0
+        self.browser_launches = 0
+
+    def __call__(self, record):
+        """Log sink: picks the events it needs out of the structured records."""
+        event = record['event']
+        if event == 'job.end':
+            with self.lock:
+                result = record.get('result', 'error')
+                self.items[result] = self.items.get(result, 0) + 1
+                if result == 'ok':
+                    self.download_seconds += record.get('spans', {}).get('download', 0) / 1000
+        elif event == 'download.end':
+            with self.lock:
+                self.bytes_total += record.get('bytes', 0) or 0
+                self.speeds.pop(record.get('job'), None)
+
+    def item_skipped(self):
+        with self.lock:
+            self.items['skipped'] += 1
+
+    def set_speed(self, key, rate):
+        with self.lock:
+            self.speeds[key] = (rate, time.monotonic())
+
+    def add_throttled(self, count=1):
+        with self.lock:
+            self.throttled += count
+
+    def browser_launched(self):
+        with self.lock:
+            self.browser_launches += 1
+
+    def capture_started(self):
+        with self.lock:
+            self.captures_in_flight += 1
+
+    def capture_finished(self):
+        with self.lock:
+            self.captures_in_flight -= 1
+
+    def observe_span(self, name, seconds):
+        with self.lock:
+            count, total = self.spans.get(name, (0, 0.0))
+            self.spans[name] = (count + 1, total + seconds)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self.lock:
+            now = time.monotonic()
+            current = [rate for rate, seen in self.speeds.values() if now - seen < self.SPEED_STALE_AFTER]
+            average = self.bytes_total / self.download_seconds if self.download_seconds else 0
+            lines = []
+
+            def metric(name, kind, help_text, samples):
+                lines.append(f"# HELP m3u8_{name} {help_text}")
+                lines.append(f"# TYPE m3u8_{name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"m3u8_{name}{labels} {value}")
+
+            metric("items_total", "counter", "Queue items by outcome.",
+                   [(f'{{result="{result}"}}', count) for result, count in self.items.items()])
+            metric("downloaded_bytes_total", "counter", "Bytes of finished downloads.", [("", self.bytes_total)])
+            metric("download_speed_bytes", "gauge", "Current download speed over all running downloads (bytes/s).",
+                   [("", int(sum(current)))])
+            metric("download_speed_average_bytes", "gauge", "Average speed of finished downloads (bytes/s).", [("", int(average))])
+            metric("downloads_in_flight", "gauge", "Downloads currently reporting progress.", [("", len(current))])
+            metric("captures_in_flight", "gauge", "Hunts currently holding a browser.", [("", self.captures_in_flight)])
+            metric("throttled_total", "counter", "HTTP 429 / throttling signals seen by the download engines.", [("", self.throttled)])
+            metric("browser_launches_total", "counter", "Browser contexts launched (first start and restarts).", [("", self.browser_launches)])
+            metric("span_seconds", "summary", "Time spent per timing span (verify = candidate verification).",
+                   [(f'_sum{{span="{name}"}}', round(total, 3)) for name, (count, total) in sorted(self.spans.items())] +
+                   [(f'_count{{span="{name}"}}', count) for name, (count, total) in sorted(self.spans.items())])
+            metric("start_time_seconds", "gauge", "When this process started (unix time).", [("", int(self.started))])
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+METRICS_STARTED = False
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def write_metrics_file(path):
+    """Atomic write, so a scraper (e.g. node_exporter's textfile collector) never reads half a file."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(METRICS.render())
+    os.replace(tmp_path, path)
+
+def start_metrics():
+    """
+    Starts the exporters configured in config.json (once per process):
+    - metrics_port: serves http://127.0.0.1:<port>/metrics
+    - metrics_file: rewrites a Prometheus text file every metrics_interval seconds
+    """
+    global METRICS_STARTED
+    path = CONFIG.get('metrics_file')
+    port = int(CONFIG.get('metrics_port', 0) or 0)
+    if METRICS_STARTED or not (path or port):
+        return
+    METRICS_STARTED = True
+    add_log_sink(METRICS)
+    if port:
+        try:
+            server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            log(f"📈 Metrics at http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            log(f"⚠️ Could not start the metrics endpoint on port {port}: {e}")
+    if path:
+        if not os.path.isabs(path):
+            path = os.path.join(get_base_dir(), path)
+        interval = max(1, int(CONFIG.get('metrics_interval', 15) or 15))
+
+        def writer():
+            while True:
+                try:
+                    write_metrics_file(path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+        threading.Thread(target=writer, name="metrics-file", daemon=True).start()
+        log(f"📈 Writing metrics to {path} every {interval}s")
 
 def get_user_input(prompt):
     if INPUT_CALLBACK: return INPUT_CALLBACK(prompt)
@@ -105,10 +531,90 @@ def check_stop():
     if STOP_CALLBACK and STOP_CALLBACK():
         raise Exception("Stopped by user")
 
+def stop_requested():
+    return bool(STOP_CALLBACK and STOP_CALLBACK())
+
+class ThreadOutput:
+    """
+    sys.stdout while plugins run: prints from a thread that registered a buffer (a plugin
+    on a worker thread) land in that buffer; everything else still reaches the console.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+
+    def write(self, text):
+        buffer = self.buffers.get(threading.get_ident())
+        if buffer is not None:
+            return buffer.write(text)
+        if self.stream is None:  # pythonw: no console
+            return len(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+THREAD_OUTPUT_LOCK = threading.Lock()
+
+@contextmanager
+def capture_thread_output(buffer):
+    """Like redirect_stdout(buffer), but only for the calling thread (other jobs keep logging)."""
+    ident = threading.get_ident()
+    with THREAD_OUTPUT_LOCK:
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        proxy = sys.stdout
+        proxy.buffers[ident] = buffer
+    try:
+        yield buffer
+    finally:
+        with THREAD_OUTPUT_LOCK:
+            proxy.buffers.pop(ident, None)
+            if not proxy.buffers and sys.stdout is proxy:
+                sys.stdout = proxy.stream
+
+# Plugin path -> (mtime, DISK_SPACE_FACTOR), so the sources are parsed once per change
+PLUGIN_SPACE_FACTORS = {}
+
 class PluginManager:
     def __init__(self):
         self.plugins_dir = os.path.join(get_base_dir(), "plugins")
 
+    def space_factor(self):
+        """
+        Peak disk usage of the plugins as a multiple of the downloaded file.
+        A plugin declares it with a module-level DISK_SPACE_FACTOR literal (default 1.0);
+        e.g. 2.0 for one that writes a full converted copy before deleting the original.
+        """
+        factor = 1.0
+        if not os.path.exists(self.plugins_dir):
+            return factor
+        for filename in sorted(f for f in os.listdir(self.plugins_dir) if f.endswith(".py") and not f.startswith("_")):
+            path = os.path.join(self.plugins_dir, filename)
+            try:
+                mtime = os.path.getmtime(path)
+                cached = PLUGIN_SPACE_FACTORS.get(path)
+                if cached is None or cached[0] != mtime:
+                    cached = PLUGIN_SPACE_FACTORS[path] = (mtime, self.read_space_factor(path))
+                factor = max(factor, cached[1])
+            except Exception:
+                pass
+        return factor
+
+    @staticmethod
+    def read_space_factor(path):
+        """DISK_SPACE_FACTOR from a plugin's source, without running the plugin."""
+        with open(path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "DISK_SPACE_FACTOR" for t in node.targets):
+                return float(ast.literal_eval(node.value))
+        return 1.0
+
     def run_plugins(self, file_path):
         """
         Scans 'plugins' folder and executes .py files sequentially.
@@ -138,7 +644,7 @@ class PluginManager:
                         new_path = None
                         
                         try:
-                            with redirect_stdout(output_buffer):
+                            with capture_thread_output(output_buffer):
                                 new_path = module.process(current_path)
                         except Exception as e:
                             # If plugin fails during execution, log everything
@@ -147,7 +653,7 @@ class PluginManager:
                             captured_output = output_buffer.getvalue()
                             if captured_output:
                                 log(captured_output, end="")
-                            log(f"      Error: {e}")
+                            log(f"      Error: {e}", level="error")
                             continue # Move to the next plugin
 
                         # Check if the plugin did something (path changed)
@@ -159,7 +665,11 @@ class PluginManager:
                                 # We use print() inside plugins, so we need to pass the whole block to log()
                                 log(captured_output, end="")
                             current_path = new_path
-                        # If the path is the same, the plugin skipped, and we silently discard its output.
+                        else:
+                            # The plugin skipped: drop its chatter, but not its warnings (e.g. low disk space)
+                            for line in output_buffer.getvalue().splitlines():
+                                if log_level(line) in ("warning", "error"):
+                                    log(f"   {line.strip()} ({filename})")
                     else:
                         log(f"   ⚠️  Skipping {filename}: No 'process' function found.")
             except Exception as e:
@@ -167,10 +677,1240 @@ class PluginManager:
         
         return current_path
 
+# In-page m3u8 extractor, installed into every frame of a pooled browser context.
+# It reports each new .m3u8 URL it sees through the __m3u8Report binding:
+# - resource timings (covers requests fired before our hooks ran),
+# - fetch/XHR responses (players often get the playlist inside a JSON blob),
+# - inline scripts and src/href attributes as the DOM changes.
+# Only the matched URLs cross the Playwright bridge, never the whole page.
+M3U8_EXTRACTOR_JS = r"""
+(() => {
+    if (window.__m3u8Rescan) return;
+    const seen = new Set();
+    const pattern = /https?:\/\/[^\s"'<>\\]+?\.m3u8[^\s"'<>\\]*/gi;
+
+    const extract = (text) => {
+        if (typeof text !== 'string' || text.indexOf('.m3u8') === -1) return [];
+        // JSON-escaped URLs ("https:\/\/cdn\/...") are common in inline player configs
+        return text.replace(/\\\//g, '/').match(pattern) || [];
+    };
+    const report = (text) => {
+        for (const url of extract(text)) {
+            if (seen.has(url)) continue;
+            seen.add(url);
+            try { window.__m3u8Report(url); } catch (e) {}
+        }
+    };
+
+    try {
+        new PerformanceObserver((list) => list.getEntries().forEach((e) => report(e.name)))
+            .observe({ type: 'resource', buffered: true });
+    } catch (e) {}
+
+    if (window.fetch) {
+        const origFetch = window.fetch;
+        window.fetch = function (...args) {
+            return origFetch.apply(this, args).then((response) => {
+                try {
+                    report(response.url);
+                    const type = response.headers.get('content-type') || '';
+                    if (/json|text|javascript|mpegurl/i.test(type)) {
+                        response.clone().text().then(report).catch(() => {});
+                    }
+                } catch (e) {}
+                return response;
+            });
+        };
+    }
+
+    const origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function (...args) {
+        this.addEventListener('load', function () {
+            try {
+                report(this.responseURL);
+                if (this.responseType === '' || this.responseType === 'text') report(this.responseText);
+            } catch (e) {}
+        });
+        return origSend.apply(this, args);
+    };
+
+    const selector = 'script:not([src]), [src*=".m3u8"], [href*=".m3u8"], [data-src*=".m3u8"]';
+    const scanNode = (node) => {
+        if (node.nodeType !== 1) return;
+        const nodes = node.matches(selector) ? [node] : [];
+        nodes.push(...node.querySelectorAll(selector));
+        for (const el of nodes) {
+            if (el.tagName === 'SCRIPT') report(el.textContent);
+            for (const attr of ['src', 'href', 'data-src']) report(el.getAttribute(attr));
+        }
+    };
+    const observe = () => {
+        scanNode(document.documentElement);
+        new MutationObserver((mutations) => {
+            for (const m of mutations) {
+                if (m.type === 'attributes') report(m.target.getAttribute(m.attributeName));
+                else m.addedNodes.forEach(scanNode);
+            }
+        }).observe(document.documentElement, {
+            childList: true, subtree: true,
+            attributes: true, attributeFilter: ['src', 'href', 'data-src'],
+        });
+    };
+    if (document.documentElement) observe();
+    else document.addEventListener('DOMContentLoaded', observe, { once: true });
+
+    // One-off full scan; returns the matches only
+    window.__m3u8Rescan = () => {
+        const found = document.documentElement ? extract(document.documentElement.outerHTML) : [];
+        found.forEach((url) => report(url));
+        return found;
+    };
+})();
+"""
+
+class BrowserSlot:
+    """One pooled persistent browser context and the profile directory it owns."""
+    def __init__(self, index, profile_dir=None):
+        self.index = index
+        # Slot 0 keeps the historical folder name so existing sessions carry over.
+        name = "browser_session" if index == 0 else f"browser_session_{index}"
+        self.user_data_dir = os.path.join(profile_dir or get_base_dir(), name)
+        self.context = None
+        self.page = None
+        self.headless = None
+        self.uses = 0
+        # Set by the capture holding this slot; receives URLs from the in-page extractor
+        self.on_candidate = None
+
+class BrowserPool:
+    """
+    Keeps Playwright and a few persistent browser contexts alive so that
+    process_video() borrows a warm browser instead of cold-starting one per URL.
+    - Each slot owns its own user data directory (a profile can only be opened once).
+    - Slots are recycled (closed and profile wiped) after 'reset_count' uses.
+    - A slot launched in the wrong mode (headless/visible) is relaunched on demand.
+    - Profiles live in the script folder unless 'profile_dir' points elsewhere.
+    """
+    def __init__(self, size=1, reset_count=0, profile_dir=None):
+        self.loop = asyncio.get_running_loop()
+        self.size = max(1, int(size))
+        self.reset_count = reset_count
+        self.profile_dir = profile_dir
+        self._playwright = None
+        self._slots = [BrowserSlot(i, profile_dir) for i in range(self.size)]
+        self._idle = list(self._slots)
+        self._cond = asyncio.Condition()
+
+    def ensure_size(self, size):
+        """Grow the pool so 'size' captures can hold a browser at the same time."""
+        while len(self._slots) < size:
+            slot = BrowserSlot(len(self._slots), self.profile_dir)
+            self._slots.append(slot)
+            self._idle.append(slot)
+
+    async def acquire(self, headless):
+        async with self._cond:
+            while not self._idle:
+                await self._cond.wait()
+            # Prefer a slot that is already running in the requested mode
+            slot = next((s for s in self._idle if s.context and s.headless == headless), self._idle[0])
+            self._idle.remove(slot)
+
+        try:
+            if slot.context is None or slot.headless != headless:
+                await self._close_slot(slot)
+                await self._launch(slot, headless)
+        except BaseException:
+            await self._return_slot(slot)
+            raise
+        return slot
+
+    async def release(self, slot, discard=False):
+        slot.uses += 1
+        if discard:
+            await self._close_slot(slot)
+        elif self.reset_count > 0 and slot.uses >= self.reset_count:
+            await self._close_slot(slot)
+            clear_session(reason=f"periodic reset after {slot.uses} items", session_dir=slot.user_data_dir)
+            slot.uses = 0
+        else:
+            try:
+                # Park the page so the previous embed stops streaming in the background
+                await slot.page.set_extra_http_headers({})
+                await slot.page.goto("about:blank", timeout=5000)
+            except Exception:
+                await self._close_slot(slot)
+        await self._return_slot(slot)
+
+    async def close(self):
+        for slot in self._slots:
+            await self._close_slot(slot)
+        if self._playwright:
+            try:
+                await self._playwright.stop()
+            except Exception:
+                pass
+            self._playwright = None
+
+    async def _return_slot(self, slot):
+        async with self._cond:
+            self._idle.append(slot)
+            self._cond.notify()
+
+    async def _close_slot(self, slot):
+        if slot.context:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        slot.context = None
+        slot.page = None
+        slot.headless = None
+
+    async def _launch(self, slot, headless):
+        METRICS.browser_launched()
+        if self._playwright is None:
+            # Ensure browsers are downloaded before launching
+            ensure_playwright_browsers()
+            self._playwright = await async_playwright().start()
+        p = self._playwright
+
+        # Use a persistent user data directory to save cookies/session
+        # Use get_base_dir() so the session folder lives next to the .exe, not in CWD
+        os.makedirs(slot.user_data_dir, exist_ok=True)
+
+        if sys.platform.startswith('linux'):
+            # Use Firefox on Linux — different TLS/browser fingerprint bypasses
+            # Cloudflare bot detection that blocks Chromium headless on Linux.
+            # Windows/Mac continue to use Chromium (proven working, unchanged).
+            context = await p.firefox.launch_persistent_context(
+                slot.user_data_dir,
+                headless=headless,
+                user_agent=USER_AGENT,
+                firefox_user_prefs={
+                    # Block JS popup windows
+                    "dom.popup_allowed_events": "",
+                    "dom.disable_open_during_load": True,
+                    # Suppress alerts/confirms/prompts
+                    "dom.disable_beforeunload": True,
+                    # Allow autoplay so the video starts without a click
+                    "media.autoplay.default": 0,
+                    "media.autoplay.blocking_policy": 0,
+                    # Force all popup windows into tabs (easier to close)
+                    "browser.link.open_newwindow": 3,
+                    "browser.link.open_newwindow.restriction": 0,
+                }
+            )
+
+            # Auto-close any ad popups or new tabs that open
+            def _close_extra_page(new_page):
+                asyncio.ensure_future(new_page.close())
+            context.on("page", _close_extra_page)
+        else:
+            # Chromium for Windows / Mac — proven working, unchanged
+            context = await p.chromium.launch_persistent_context(
+                slot.user_data_dir,
+                headless=headless,
+                viewport=None if not headless else {'width': 1280, 'height': 720},
+                user_agent=USER_AGENT,
+                bypass_csp=True,
+                args=[
+                    '--disable-web-security',
+                    '--disable-features=IsolateOrigins,site-per-process',
+                    '--autoplay-policy=no-user-gesture-required',
+                    '--disable-blink-features=AutomationControlled',
+                    # Only minimize in headless mode. In visible mode, a minimized window
+                    # prevents Cloudflare from completing its JS challenge → about:blank
+                    *(['--start-minimized'] if headless else []),
+                    '--disable-backgrounding-occluded-windows',
+                    '--disable-renderer-backgrounding',
+                    '--disable-background-timer-throttling',
+                ],
+                ignore_default_args=["--enable-automation"]
+            )
+
+        page = context.pages[0] if context.pages else await context.new_page()
+
+        # Optimzed Ad-blocking: Block images/media natively, and only check scripts for ads
+        ad_regex = re.compile(r'googlesyndication|doubleclick|adnxs|ads-twitter|facebook|quantserve|taboola|outbrain|advertising|mathtag|dtscout|amazon-adsystem', re.IGNORECASE)
+
+        async def block_junk(route):
+            request = route.request
+            if request.resource_type in ["image", "media", "font"]:
+                return await route.abort()
+
+            url = request.url.lower()
+            if "unpkg.com" in url or ad_regex.search(url):
+                return await route.abort()
+
+            await route.continue_()
+
+        await context.route("**/*", block_junk)
+
+        # Inject safe stealth overrides. Only the 4 known-safe properties —
+        # permissions.query and navigator.platform overrides were found to
+        # interfere with cloudnestra's player JavaScript on Windows.
+        await page.add_init_script("""
+            Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
+            Object.defineProperty(navigator, 'plugins', {
+                get: () => [
+                    { name: 'Chrome PDF Plugin' },
+                    { name: 'Chrome PDF Viewer' },
+                    { name: 'Native Client' }
+                ]
+            });
+            Object.defineProperty(navigator, 'languages', { get: () => ['en-US', 'en'] });
+            window.chrome = { runtime: {} };
+
+            // Fix HeadlessChrome in userAgent without recursion (Linux headless)
+            try {
+                const _origUA = Object.getOwnPropertyDescriptor(Navigator.prototype, 'userAgent').get.call(navigator);
+                Object.defineProperty(navigator, 'userAgent', {
+                    get: () => _origUA.replace('HeadlessChrome', 'Chrome')
+                });
+            } catch(e) {}
+        """)
+
+        # One binding per context, dispatched to whichever capture holds the slot
+        def report_candidate(source, url):
+            if slot.on_candidate:
+                slot.on_candidate(url)
+
+        await context.expose_binding("__m3u8Report", report_candidate)
+        await context.add_init_script(M3U8_EXTRACTOR_JS)
+
+        slot.context = context
+        slot.page = page
+        slot.headless = headless
+
+BROWSER_POOL = None
+
+def get_browser_pool():
+    """Return the pool bound to the running event loop, creating it on first use."""
+    global BROWSER_POOL
+    loop = asyncio.get_running_loop()
+    if BROWSER_POOL is None or BROWSER_POOL.loop is not loop:
+        BROWSER_POOL = BrowserPool(size=CONFIG.get('capture_workers', 1), reset_count=CONFIG.get('session_reset_count', 5))
+    return BROWSER_POOL
+
+async def close_browser_pool():
+    global BROWSER_POOL
+    pool, BROWSER_POOL = BROWSER_POOL, None
+    if pool is not None and pool.loop is asyncio.get_running_loop():
+        await pool.close()
+
+async def with_browser_pool(coro):
+    """Await 'coro' and shut the browser pool down afterwards (for one-shot asyncio.run callers)."""
+    try:
+        return await coro
+    finally:
+        await close_browser_pool()
+
+def parse_rate(value):
+    """Convert a yt-dlp style rate ('6M', '500K', '1.5M') to bytes/s. 'Unlimited' or empty -> None."""
+    if not value:
+        return None
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?)', str(value), re.IGNORECASE)
+    if not match:
+        return None
+    multiplier = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[match.group(2).upper()]
+    return int(float(match.group(1)) * multiplier)
+
+def format_rate(rate):
+    """Convert bytes/s back to the compact form yt-dlp's --limit-rate accepts."""
+    if rate >= 1024 ** 2:
+        return f"{rate / 1024 ** 2:.1f}M"
+    return f"{max(1, rate // 1024)}K"
+
+class RateController:
+    """
+    Adaptive download rate per CDN host:
+    - Hosts we haven't seen start fast, at the ceiling: max_download_speed, or the
+      download_speed setting (the GUI "Speed" menu) when that is lower.
+    - 429s or fragment failures halve the rate (never below min_download_speed).
+    - After rate_probe_after seconds without throttling, the rate probes upward by 25%.
+    - Learned rates are kept in rate_limits.json so later runs start from what worked.
+    """
+    BACKOFF = 0.5
+    PROBE_STEP = 1.25
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_base_dir(), "rate_limits.json")
+        self.hosts = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.hosts = json.load(f)
+            except Exception as e:
+                log(f"   ⚠️ Could not read {os.path.basename(self.path)}: {e}")
+
+    def save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.hosts, f, indent=4)
+        except Exception as e:
+            log(f"   ⚠️ Could not save {os.path.basename(self.path)}: {e}")
+
+    @staticmethod
+    def ceiling():
+        """Highest rate any host gets, in bytes/s (None = unlimited)."""
+        caps = [rate for rate in (parse_rate(CONFIG.get('max_download_speed', '25M')),
+                                  parse_rate(CONFIG.get('download_speed'))) if rate]
+        return min(caps) if caps else None
+
+    def peek(self, host):
+        """Rate rate_for() would hand out right now, without probing or saving."""
+        ceiling = self.ceiling()
+        entry = self.hosts.get(host)
+        if not entry:
+            return ceiling
+        return min(entry['rate'], ceiling) if ceiling else entry['rate']
+
+    def rate_for(self, host):
+        """Current rate for 'host' in bytes/s (None = unlimited), probing upward when it has been quiet."""
+        ceiling = self.ceiling()
+        entry = self.hosts.get(host)
+        if not entry:
+            return ceiling
+
+        now = time.time()
+        probe_after = CONFIG.get('rate_probe_after', 600)
+        if now - entry.get('last_throttle', 0) >= probe_after and now - entry.get('updated', 0) >= probe_after:
+            rate = entry['rate'] * self.PROBE_STEP
+            if ceiling and rate >= ceiling:
+                # Back at the ceiling: nothing left to learn for this host
+                del self.hosts[host]
+                self.save()
+                log(f"   📈 {host} has been quiet. Back to full speed ({format_rate(ceiling)}/s).")
+                return ceiling
+            entry['rate'] = int(rate)
+            entry['updated'] = now
+            self.save()
+            log(f"   📈 {host} has been quiet. Probing up to {format_rate(entry['rate'])}/s.")
+        # The Speed setting may have been lowered since this rate was learned
+        return min(entry['rate'], ceiling) if ceiling else entry['rate']
+
+    def on_throttle(self, host, current=None, observed=None):
+        """Record a throttling signal from 'host' and return the backed-off rate in bytes/s."""
+        floor = parse_rate(CONFIG.get('min_download_speed', '1M')) or 0
+        entry = self.hosts.get(host, {})
+        # Back off from the slower of the cap and the speed actually reached (a new host's cap is 25M)
+        base = min(current, observed) if current and observed else (current or observed or entry.get('rate') or parse_rate(CONFIG.get('download_speed')) or parse_rate(DOWNLOAD_SPEED))
+        rate = int(max(floor, base * self.BACKOFF))
+        now = time.time()
+        self.hosts[host] = {'rate': rate, 'updated': now, 'last_throttle': now}
+        self.save()
+        log(f"   📉 Throttled by {host}. Backing off to {format_rate(rate)}/s.")
+        return rate
+
+RATE_CONTROLLER = None
+
+def get_rate_controller():
+    global RATE_CONTROLLER
+    if RATE_CONTROLLER is None:
+        RATE_CONTROLLER = RateController()
+    return RATE_CONTROLLER
+
+def manual_ytdlp_command(final_filename, master_url, rate=None):
+    """
+    The yt-dlp command line shown for manual retries. 'rate' is the limit the
+    download actually ran with; without one, the rate a download from this
+    host would get now is used.
+    """
+    if rate is None:
+        if CONFIG.get('adaptive_rate', True):
+            rate = get_rate_controller().peek(urllib.parse.urlparse(master_url).hostname or "")
+        else:
+            rate = parse_rate(CONFIG.get('download_speed', DOWNLOAD_SPEED))
+    limit = f"--limit-rate {format_rate(rate)} " if rate else ""
+    return (f'yt-dlp --ignore-errors --no-warnings --fixup detect_or_warn --fragment-retries 10 --retry-sleep fragment:5 '
+            f'--hls-prefer-native {limit}--user-agent "{USER_AGENT}" -o "{final_filename}" "{master_url}"')
+
+class BandwidthManager:
+    """
+    Process-wide bandwidth budget shared by every active download:
+    - total_download_speed caps the sum of all downloads (empty/'Unlimited' = no cap).
+    - Each CDN host keeps its own cap (adaptive or fixed, see RateController),
+      split between the downloads that use it.
+    - What is left of the total is shared fairly: downloads held below their fair
+      share by a host cap hand the remainder to the others. Shares are recomputed
+      whenever a download starts, finishes or its host cap changes.
+    Native downloads pace themselves through consume(); yt-dlp can't be adjusted
+    mid-run, so it is given a fixed share at start: total / max(download_workers,
+    active downloads), within its host cap.
+    """
+    def __init__(self):
+        self.jobs = {}
+        self.host_caps = {}
+        self.shares = {}
+        self.buckets = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def register(self, host, host_cap, fixed=False):
+        """Adds a download and returns its id. 'fixed' downloads (yt-dlp) keep the share they start with."""
+        with self.lock:
+            self.next_id += 1
+            job = self.next_id
+            self.jobs[job] = {'host': host, 'fixed': None}
+            self.host_caps[host] = host_cap
+            self._rebalance()
+            if fixed:
+                total = parse_rate(CONFIG.get('total_download_speed', ''))
+                workers = max(1, int(CONFIG.get('download_workers', 1)))
+                share = self.shares[job]
+                if total:
+                    # Not the water-filling result: when others hold the budget that is the
+                    # 1 KB/s keep-alive floor, and yt-dlp would be stuck with it for the whole run
+                    share = total / max(workers, len(self.jobs))
+                    if host_cap:
+                        share = min(share, host_cap / sum(1 for info in self.jobs.values() if info['host'] == host))
+                self.jobs[job]['fixed'] = share
+                self._rebalance()
+            return job
+
+    def unregister(self, job):
+        with self.lock:
+            self.jobs.pop(job, None)
+            self.buckets.pop(job, None)
+            self._rebalance()
+
+    def update_host_cap(self, host, host_cap):
+        with self.lock:
+            self.host_caps[host] = host_cap
+            self._rebalance()
+
+    def share(self, job):
+        """Current rate for 'job' in bytes/s (None = unlimited)."""
+        return self.shares.get(job)
+
+    def _rebalance(self):
+        total = parse_rate(CONFIG.get('total_download_speed', ''))
+        per_host = {}
+        for job, info in self.jobs.items():
+            per_host.setdefault(info['host'], []).append(job)
+        limits = {}
+        for host, jobs in per_host.items():
+            cap = self.host_caps.get(host)
+            for job in jobs:
+                limits[job] = cap / len(jobs) if cap else None
+
+        shares = {}
+        flexible = []
+        remaining = total
+        for job, info in self.jobs.items():
+            if info['fixed'] is not None:
+                shares[job] = info['fixed']
+                if remaining:
+                    remaining = max(0, remaining - (info['fixed'] or 0))
+            else:
+                flexible.append(job)
+        if not total:
+            for job in flexible:
+                shares[job] = limits[job]
+        else:
+            # Water-filling: jobs whose host cap is below the fair share keep their cap
+            while flexible:
+                fair = remaining / len(flexible)
+                capped = [job for job in flexible if limits[job] is not None and limits[job] <= fair]
+                if not capped:
+                    for job in flexible:
+                        # Never stall a download completely; 1 KB/s keeps its connection alive
+                        shares[job] = max(fair, 1024)
+                    break
+                for job in capped:
+                    shares[job] = limits[job]
+                    remaining -= limits[job]
+                    flexible.remove(job)
+        self.shares = shares
+
+    async def consume(self, job, nbytes):
+        """Token bucket: waits until 'job' may write another 'nbytes' at its current share."""
+        rate = self.share(job)
+        if not rate:
+            return
+        now = time.monotonic()
+        tokens, last = self.buckets.get(job, (0, now))
+        # Refill, allowing at most one second of burst
+        tokens = min(rate, tokens + (now - last) * rate) - nbytes
+        self.buckets[job] = (tokens, now)
+        if tokens < 0:
+            await asyncio.sleep(-tokens / rate)
+
+BANDWIDTH_MANAGER = BandwidthManager()
+
+# Peak usage of a download alone: the segments plus the remuxed .mkv until the segments are deleted
+DOWNLOAD_SPACE_FACTOR = 2.0
+
+def estimate_stream_bytes(variant, duration):
+    """Expected size of a variant's download, from its advertised bitrate and the playlist duration."""
+    if not variant or not variant.bandwidth or not duration:
+        return 0
+    return int(variant.bandwidth / 8 * duration)
+
+class DiskSpaceManager:
+    """
+    Reserves disk space for downloads in flight, so overlapping jobs don't all
+    see the same free space:
+    - A job reserves its expected peak usage on the drive it writes to.
+    - What a job has already written (matched by file name prefix) counts against
+      its own reservation, so the same bytes aren't subtracted twice.
+    - A job that can't fit is refused before anything is downloaded.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    @staticmethod
+    def written(folder, prefix):
+        total = 0
+        try:
+            for name in os.listdir(folder):
+                if name.startswith(prefix):
+                    total += os.path.getsize(os.path.join(folder, name))
+        except OSError:
+            pass
+        return total
+
+    def reserve(self, path, nbytes, margin=0):
+        """
+        Reserves nbytes for the files of 'path' (path itself and e.g. path.ts, path.part...).
+        Returns (ok, bytes still needed, bytes available to this job).
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        prefix = os.path.splitext(os.path.basename(path))[0] + "."
+        device = os.stat(folder).st_dev
+        with self.lock:
+            held = sum(max(0, job['bytes'] - self.written(job['folder'], job['prefix']))
+                       for key, job in self.jobs.items() if job['device'] == device and key != path)
+            available = shutil.disk_usage(folder).free - held - margin
+            # A resumed download already has part of its reservation on disk
+            needed = max(0, nbytes - self.written(folder, prefix))
+            if needed > available:
+                return False, needed, available
+            self.jobs[path] = {'device': device, 'folder': folder, 'prefix': prefix, 'bytes': nbytes}
+            return True, needed, available
+
+    def release(self, *paths):
+        with self.lock:
+            for path in paths:
+                self.jobs.pop(path, None)
+
+DISK_SPACE = DiskSpaceManager()
+
+async def reserve_disk_space(finder, master_url, temp_filename, final_filename):
+    """
+    Pre-flight check before a download starts.
+    Returns the reserved paths (to release afterwards), or None if the download won't fit.
+    """
+    if not CONFIG.get('check_disk_space', True):
+        return []
+    estimate = await finder.estimate_download_size(master_url)
+    if not estimate:
+        log("   ℹ️  Stream size unknown. Skipping the disk space check.")
+        return []
+    margin = int(CONFIG.get('disk_space_margin_mb', 500)) * 1024 * 1024
+    peak = int(estimate * max(DOWNLOAD_SPACE_FACTOR, PluginManager().space_factor()))
+    mb = 1024 * 1024
+    log(f"   💽 Estimated size: {estimate / mb:.0f} MB (up to {peak / mb:.0f} MB while processing)")
+
+    reserved = []
+    targets = [(temp_filename, peak)]
+    try:
+        if os.stat(os.path.dirname(os.path.abspath(final_filename))).st_dev != os.stat(os.path.dirname(os.path.abspath(temp_filename))).st_dev:
+            # Staging on another drive: the finished file is copied across as well
+            targets.append((final_filename, estimate))
+    except OSError:
+        pass
+    for path, nbytes in targets:
+        try:
+            ok, needed, available = DISK_SPACE.reserve(path, nbytes, margin)
+        except OSError as e:
+            log(f"   ⚠️ Could not check free space ({e}).")
+            continue
+        if not ok:
+            DISK_SPACE.release(*reserved)
+            log(f"❌ Not enough disk space in {os.path.dirname(os.path.abspath(path))}: "
+                f"needs {needed / mb:.0f} MB, {max(0, available) / mb:.0f} MB available "
+                f"(keeping {margin // mb} MB free and space reserved by other downloads).")
+            return None
+        reserved.append(path)
+    return reserved
+
+class CaptureCache:
+    """
+    Remembers what recent hunts found (capture_cache.json):
+    - Maps embed URL -> master URL, title, session cookies and capture time.
+    - Entries older than capture_cache_ttl seconds are ignored (0 disables the cache).
+    - A cached master URL is re-checked over plain HTTP before use, so a retry
+      costs one request instead of a full browser hunt.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_base_dir(), "capture_cache.json")
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                log(f"   ⚠️ Could not read {os.path.basename(self.path)}: {e}")
+
+    def save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=4)
+        except Exception as e:
+            log(f"   ⚠️ Could not save {os.path.basename(self.path)}: {e}")
+
+    def get(self, url):
+        ttl = CONFIG.get('capture_cache_ttl', 1800)
+        entry = self.entries.get(url)
+        if not entry or not ttl:
+            return None
+        if time.time() - entry.get('ts', 0) > ttl:
+            self.drop(url)
+            return None
+        return entry
+
+    def put(self, url, master_url, title, cookie_file=None):
+        if not CONFIG.get('capture_cache_ttl', 1800):
+            return
+        cookies = ""
+        if cookie_file and os.path.exists(cookie_file):
+            try:
+                with open(cookie_file, 'r', encoding='utf-8') as f:
+                    cookies = f.read()
+            except:
+                pass
+        now = time.time()
+        ttl = CONFIG.get('capture_cache_ttl', 1800)
+        # Prune expired entries while we're writing anyway
+        self.entries = {k: v for k, v in self.entries.items() if now - v.get('ts', 0) <= ttl}
+        self.entries[url] = {'master_url': master_url, 'title': title, 'cookies': cookies, 'ts': now}
+        self.save()
+
+    def drop(self, url):
+        if self.entries.pop(url, None) is not None:
+            self.save()
+
+    @staticmethod
+    def verify(master_url, cookie_file=None):
+        """Same test get_working_url() applies to candidates: a quick ranged GET must return a playlist."""
+        session = requests.Session()
+        session.headers.update({"User-Agent": USER_AGENT})
+        if cookie_file and os.path.exists(cookie_file):
+            try:
+                jar = http.cookiejar.MozillaCookieJar(cookie_file)
+                jar.load(ignore_discard=True, ignore_expires=True)
+                session.cookies = jar
+            except:
+                pass
+        try:
+            with session.get(master_url, headers=probe_range_header(), timeout=2, stream=True) as response:
+                if not response.ok:
+                    return False
+                body = next(response.iter_content(PLAYLIST_PROBE_BYTES), b"")
+                return sniff_playlist(body, truncated=True) is not None
+        except:
+            return False
+        finally:
+            session.close()
+
+CAPTURE_CACHE = None
+
+def get_capture_cache():
+    global CAPTURE_CACHE
+    if CAPTURE_CACHE is None:
+        CAPTURE_CACHE = CaptureCache()
+    return CAPTURE_CACHE
+
+class CompletedStore:
+    """
+    Indexed record of finished queue items (completed.db):
+    - Keyed by URL, with an (imdb_id, season, episode) index so an episode is
+      recognised no matter which mirror domain the queue link points at.
+    - Movies are stored with season/episode left empty.
+    - The old completed.log is imported once on first use.
+    Safe to share between the GUI worker thread and the asyncio loop.
+    """
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_base_dir(), "completed.db")
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""CREATE TABLE IF NOT EXISTS completed (
+                url TEXT PRIMARY KEY,
+                imdb_id TEXT,
+                season INTEGER,
+                episode INTEGER,
+                completed_at REAL)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS completed_key ON completed (imdb_id, season, episode)")
+        self.migrate_log(os.path.join(os.path.dirname(self.path), "completed.log"))
+
+    @staticmethod
+    def parse_key(url):
+        """Returns (imdb_id, season, episode) for a queue link; season/episode are None for movies."""
+        imdb_m = re.search(r'(tt\d{7,})', url)
+        s_m = re.search(r'[?&]season=(\d+)', url)
+        e_m = re.search(r'[?&]episode=(\d+)', url)
+        if s_m and e_m:
+            return (imdb_m.group(1) if imdb_m else None, int(s_m.group(1)), int(e_m.group(1)))
+        return (imdb_m.group(1) if imdb_m else None, None, None)
+
+    def migrate_log(self, log_path):
+        """One-time import of completed.log (tracked with PRAGMA user_version)."""
+        with self.lock:
+            if self.db.execute("PRAGMA user_version").fetchone()[0] >= 1:
+                return
+            imported = 0
+            if os.path.exists(log_path):
+                try:
+                    with open(log_path, 'r', encoding='utf-8') as f:
+                        urls = {line.strip() for line in f if line.strip()}
+                    with self.db:
+                        self.db.executemany(
+                            "INSERT OR IGNORE INTO completed VALUES (?, ?, ?, ?, ?)",
+                            [(url, *self.parse_key(url), None) for url in urls])
+                    imported = len(urls)
+                except Exception as e:
+                    log(f"   ⚠️ Could not import completed.log: {e}")
+                    return
+            self.db.execute("PRAGMA user_version = 1")
+            if imported:
+                log(f"📂 Imported {imported} entries from completed.log into {os.path.basename(self.path)}.")
+
+    def is_completed(self, url):
+        """True if this exact link, or the same movie/episode under another link, was finished."""
+        imdb_id, season, episode = self.parse_key(url)
+        with self.lock:
+            if self.db.execute("SELECT 1 FROM completed WHERE url = ?", (url,)).fetchone():
+                return True
+            if imdb_id is None:
+                return False
+            return self.db.execute(
+                "SELECT 1 FROM completed WHERE imdb_id = ? AND season IS ? AND episode IS ? LIMIT 1",
+                (imdb_id, season, episode)).fetchone() is not None
+
+    def mark(self, url):
+        try:
+            with self.lock, self.db:
+                self.db.execute("INSERT OR REPLACE INTO completed VALUES (?, ?, ?, ?, ?)",
+                                (url, *self.parse_key(url), time.time()))
+            return True
+        except Exception as e:
+            log(f"   ⚠️ Could not update {os.path.basename(self.path)}: {e}")
+            return False
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM completed").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+COMPLETED_STORE = None
+
+def get_completed_store():
+    global COMPLETED_STORE
+    if COMPLETED_STORE is None:
+        COMPLETED_STORE = CompletedStore()
+    return COMPLETED_STORE
+
+class LibraryIndex:
+    """
+    Cached view of finished files in the library, used by the resume checks:
+    - A folder is listed once and only listed again when its mtime changes, so
+      a 500-episode queue costs one listing per season instead of one per episode
+      (which matters on network shares).
+    - Episodes are indexed by their SxxEyy tag, movies by their folder title.
+    """
+    EPISODE_TAG = re.compile(r'S(\d+)E(\d+)')
+
+    def __init__(self):
+        self.dirs = {}
+        self.lock = threading.Lock()
+
+    def _listing(self, path):
+        """Returns (mkv names, {(season, episode): name}) for a folder."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return [], {}
+        with self.lock:
+            cached = self.dirs.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+        try:
+            names = sorted(f for f in os.listdir(path) if f.endswith(".mkv"))
+        except OSError:
+            return [], {}
+        episodes = {}
+        for name in names:
+            for m in self.EPISODE_TAG.finditer(name):
+                episodes.setdefault((int(m.group(1)), int(m.group(2))), name)
+        with self.lock:
+            self.dirs[path] = (mtime, names, episodes)
+        return names, episodes
+
+    def find_episode(self, series_dir, season, episode):
+        """File name of an existing episode in '<series_dir>/Season NN', or None."""
+        _, episodes = self._listing(os.path.join(series_dir, f"Season {season:02d}"))
+        return episodes.get((season, episode))
+
+    def find_episode_for_url(self, series_dir, url):
+        """Like find_episode(), reading season/episode from a queue link. None for movie links."""
+        s_m = re.search(r'[?&]season=(\d+)', url)
+        e_m = re.search(r'[?&]episode=(\d+)', url)
+        if not (s_m and e_m):
+            return None
+        return self.find_episode(series_dir, int(s_m.group(1)), int(e_m.group(1)))
+
+    def find_movie(self, title):
+        """Path of an existing movie file for 'title' (as laid out by get_output_paths), or None."""
+        final_dir, filename = get_output_paths(title, "")
+        names, _ = self._listing(final_dir)
+        if not names:
+            return None
+        return os.path.join(final_dir, filename if filename in names else names[0])
+
+    def forget(self, path):
+        """
+        Drops a cached folder listing after we write into it ourselves; the mtime
+        check alone can miss that on shares with coarse timestamps.
+        """
+        with self.lock:
+            self.dirs.pop(path, None)
+
+LIBRARY_INDEX = None
+
+def get_library_index():
+    global LIBRARY_INDEX
+    if LIBRARY_INDEX is None:
+        LIBRARY_INDEX = LibraryIndex()
+    return LIBRARY_INDEX
+
+# How much of a candidate playlist to fetch when verifying it
+PLAYLIST_PROBE_BYTES = 8192
+
+def probe_range_header():
+    return {'Range': f'bytes=0-{PLAYLIST_PROBE_BYTES - 1}'}
+
+def probe_truncated(status, headers):
+    """True if a ranged probe returned only part of the file (206 with a larger total)."""
+    if status != 206:
+        return False
+    content_range = {k.lower(): v for k, v in (headers or {}).items()}.get('content-range', '')
+    match = re.search(r'(\d+)-(\d+)/(\d+|\*)', content_range)
+    return not match or match.group(3) == '*' or int(match.group(2)) + 1 < int(match.group(3))
+
+def sniff_playlist(body, truncated=False):
+    """
+    Returns the playlist text if 'body' starts with #EXTM3U, otherwise None
+    (HTML error pages often come back as 200). A partial trailing line is
+    dropped when the probe was truncated.
+    """
+    text = body.decode('utf-8', errors='replace').lstrip('\ufeff').lstrip()
+    if not text.startswith('#EXTM3U'):
+        return None
+    if truncated and '\n' in text:
+        text = text[:text.rindex('\n') + 1]
+    return text
+
+def variant_policy():
+    """The variant limits from config.json as keyword arguments for m3u8_parser.select_variant()."""
+    return {
+        'max_height': int(CONFIG.get('variant_max_height', 0) or 0),
+        'max_kbps': int(CONFIG.get('variant_max_kbps', 0) or 0),
+        'min_kbps': int(CONFIG.get('variant_min_kbps', 0) or 0),
+    }
+
+class UnsupportedStream(Exception):
+    """Raised when a playlist uses features the native engine can't handle (encryption, split audio...)."""
+
+class NativeHLSDownloader:
+    """
+    Built-in alternative to yt-dlp ('download_engine': 'native'):
+    1. Parses master.m3u8 and picks a variant (highest bitrate unless config.json limits it).
+    2. Fetches media segments concurrently over one pooled requests.Session.
+    3. Writes them to a .ts file strictly in playlist order.
+    4. Remuxes the .ts into the .mkv output with FFmpeg (stream copy).
+    """
+    def __init__(self, concurrency=6, retries=5, cookie_file=None):
+        self.concurrency = max(1, int(concurrency))
+        self.retries = max(0, int(retries))
+        # Bumped from the executor threads on every 429; read by the writer loop
+        self.throttled = 0
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        if cookie_file and os.path.exists(cookie_file):
+            try:
+                jar = http.cookiejar.MozillaCookieJar(cookie_file)
+                jar.load(ignore_discard=True, ignore_expires=True)
+                self.session.cookies = jar
+            except Exception as e:
+                log(f"   ⚠️ Could not load cookies: {e}")
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        # Variant picked by resolve_media_playlist() (None when given a media playlist)
+        self.variant = None
+
+    @staticmethod
+    def manifest_path(ts_file):
+        return ts_file + ".json"
+
+    @classmethod
+    def discard_partial(cls, ts_file):
+        """Removes a partial .ts and its resume manifest."""
+        for path in (ts_file, cls.manifest_path(ts_file)):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except:
+                    pass
+
+    def save_manifest(self, ts_file, manifest):
+        """Atomically rewrites the sidecar manifest next to the partial .ts."""
+        path = self.manifest_path(ts_file)
+        manifest['updated'] = time.time()
+        try:
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            log(f"   ⚠️ Could not save resume data: {e}")
+
+    @staticmethod
+    def preallocate(out, nbytes):
+        """Reserves nbytes for 'out' up front so the filesystem can keep the file in one piece."""
+        if nbytes <= out.tell():
+            return
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(out.fileno(), 0, nbytes)
+            else:
+                # On Windows (NTFS), extending the file allocates its clusters
+                position = out.tell()
+                out.truncate(nbytes)
+                out.seek(position)
+        except OSError as e:
+            log(f"   ⚠️ Could not preallocate {nbytes // (1024*1024)} MB: {e}")
+
+    def resume_point(self, ts_file, manifest):
+        """
+        Returns (completed segments, byte offset) to continue from, or (0, 0) to start over.
+        A partial download is only reused if it is for the same variant and segment layout;
+        the stream URLs themselves usually change between captures (tokens).
+        """
+        path = self.manifest_path(ts_file)
+        if not os.path.exists(path) or not os.path.exists(ts_file):
+            return 0, 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except Exception:
+            return 0, 0
+        same_stream = (saved.get('variant') == manifest['variant']
+                       and saved.get('segments') == manifest['segments']
+                       and abs(saved.get('duration', 0) - manifest['duration']) < 1
+                       and saved.get('has_init') == manifest['has_init'])
+        completed, offsets = saved.get('completed', 0), saved.get('offsets', [])
+        # A truncated or hand-edited manifest can't be trusted either
+        if not isinstance(completed, int) or not isinstance(offsets, list) or not 0 <= completed <= len(offsets):
+            log("   ℹ️  Partial download manifest is damaged. Starting over.")
+            return 0, 0
+        offset = offsets[completed - 1] if completed else saved.get('init_size', 0)
+        if not same_stream or os.path.getsize(ts_file) < offset:
+            log("   ℹ️  Partial download is for a different stream. Starting over.")
+            return 0, 0
+        manifest['init_size'] = saved.get('init_size', 0)
+        manifest['offsets'] = offsets[:completed]
+        return completed, offset
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+    def _get(self, url):
+        """Blocking GET with retries; runs on the executor threads."""
+        delay = 1
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=30)
+                if response.ok:
+                    return response.content
+                error = f"HTTP {response.status_code}"
+                if response.status_code == 429:
+                    # Rate limited: back off harder than for a plain network hiccup
+                    self.throttled += 1
+                    METRICS.add_throttled()
+                    delay = max(delay, 5)
+                elif response.status_code in (403, 404, 410):
+                    raise RuntimeError(f"{error} for {url[:80]}")
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < self.retries:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        raise RuntimeError(f"Giving up after {self.retries + 1} attempts ({error}): {url[:80]}")
+
+    async def fetch(self, url):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._get, url)
+
+    async def fetch_text(self, url):
+        return (await self.fetch(url)).decode('utf-8', errors='replace')
+
+    async def resolve_media_playlist(self, master_url, master_text=None):
+        """Follow master.m3u8 to the variant picked by the config policy. Returns (media_url, media_text)."""
+        text = master_text or await self.fetch_text(master_url)
+        if not m3u8_parser.is_playlist(text):
+            raise RuntimeError("Response is not an M3U8 playlist")
+        master = m3u8_parser.parse_master(text, master_url)
+        if not master.variants:
+            self.variant = None
+            return master_url, text
+        # Variants whose audio lives in a separate rendition would need a second download + mux
+        variants = [v for v in master.variants if not master.has_separate_audio(v)]
+        if not variants:
+            raise UnsupportedStream("audio is delivered as a separate rendition")
+        variant = m3u8_parser.select_variant(variants, **variant_policy())
+        self.variant = variant
+        log(f"   🎚️  Variant: {variant.resolution} @ {variant.bandwidth // 1000} kbps ({len(master.variants)} available)")
+        return variant.uri, await self.fetch_text(variant.uri)
+
+    async def download(self, master_url, ts_file, status_prefix="", master_text=None):
+        """Download all segments of the selected variant into ts_file, in order."""
+        media_url, media_text = await self.resolve_media_playlist(master_url, master_text)
+        playlist = m3u8_parser.parse_media(media_text, media_url)
+        if playlist.key_method:
+            raise UnsupportedStream(f"encrypted stream ({playlist.key_method})")
+        if playlist.byte_ranges:
+            raise UnsupportedStream("byte-range segments")
+        init_uri, duration = playlist.init_uri, playlist.duration
+        segments = [segment.uri for segment in playlist.segments]
+        if not segments:
+            raise RuntimeError("Media playlist has no segments")
+        log(f"   📦 {len(segments)} segments ({duration / 60:.0f} min), {self.concurrency} in parallel")
+
+        host = urllib.parse.urlparse(media_url).hostname or ""
+        controller = get_rate_controller() if CONFIG.get('adaptive_rate', True) else None
+        rate = controller.rate_for(host) if controller else parse_rate(CONFIG.get('download_speed', DOWNLOAD_SPEED))
+        # The host's rate is only a cap; the actual share comes from the global budget
+        job = BANDWIDTH_MANAGER.register(host, rate)
+        share = BANDWIDTH_MANAGER.share(job)
+        log(f"   Rate limit: {format_rate(share) + '/s' if share else 'Unlimited'}")
+        seen_throttles = 0
+        last_backoff = 0
+        # Bytes written since mark_time, used to measure throughput when we get throttled
+        mark_time, mark_bytes = time.monotonic(), 0
+        # Same, for the current-speed metric
+        speed_time, speed_bytes = time.monotonic(), 0
+
+        total = len(segments)
+        variant = self.variant
+        # Sidecar manifest: segments [0, completed) are in ts_file; offsets[i] is the file size after segment i
+        manifest = {
+            'master_url': master_url,
+            'media_url': media_url,
+            'variant': {'resolution': variant.resolution, 'bandwidth': variant.bandwidth} if variant else None,
+            'segments': total,
+            'duration': round(duration, 1),
+            'has_init': bool(init_uri),
+            'init_size': 0,
+            'completed': 0,
+            'offsets': [],
+        }
+        written, offset = self.resume_point(ts_file, manifest)
+        if written >= total:
+            log(f"   ⏯️  All {total} segments were already downloaded ({offset / (1024*1024):.1f} MB)")
+        elif written:
+            log(f"   ⏯️  Resuming at segment {written + 1}/{total} ({offset / (1024*1024):.1f} MB already downloaded)")
+        window = deque()
+        next_index = written
+        out = None
+        try:
+            if written:
+                out = open(ts_file, 'r+b')
+                # Drop anything after the last segment that was fully recorded
+                out.truncate(offset)
+                out.seek(offset)
+            else:
+                out = open(ts_file, 'wb')
+                if init_uri:
+                    out.write(await self.fetch(init_uri))
+                    manifest['init_size'] = out.tell()
+                if CONFIG.get('preallocate_downloads', False):
+                    self.preallocate(out, estimate_stream_bytes(variant, duration))
+            with out:
+                while next_index < total or window:
+                    check_stop()
+                    # Keep a bounded window of in-flight segments so memory stays flat
+                    while next_index < total and len(window) < self.concurrency * 2:
+                        window.append(asyncio.ensure_future(self.fetch(segments[next_index])))
+                        next_index += 1
+                    data = await window.popleft()
+                    out.write(data)
+                    written += 1
+                    manifest['offsets'].append(out.tell())
+                    manifest['completed'] = written
+                    mark_bytes += len(data)
+                    speed_bytes += len(data)
+                    if written % 5 == 0 or written == total:
+                        report_status(f"{status_prefix}Downloading {written * 100 / total:.1f}%")
+                        elapsed = time.monotonic() - speed_time
+                        if elapsed >= 1:
+                            METRICS.set_speed(current_job_key(), speed_bytes / elapsed)
+                            speed_time, speed_bytes = time.monotonic(), 0
+                    if written % 10 == 0:
+                        out.flush()
+                        self.save_manifest(ts_file, manifest)
+
+                    if controller:
+                        new_rate = rate
+                        if self.throttled > seen_throttles and time.monotonic() - last_backoff > 10:
+                            # One back-off per burst of 429s, judged against what we actually achieved
+                            seen_throttles = self.throttled
+                            last_backoff = time.monotonic()
+                            elapsed = time.monotonic() - mark_time
+                            observed = mark_bytes / elapsed if elapsed > 0 else None
+                            new_rate = controller.on_throttle(host, current=rate, observed=observed)
+                        elif written % 50 == 0:
+                            new_rate = controller.rate_for(host)
+                        if new_rate != rate:
+                            rate = new_rate
+                            BANDWIDTH_MANAGER.update_host_cap(host, rate)
+                            mark_time, mark_bytes = time.monotonic(), 0
+
+                    await BANDWIDTH_MANAGER.consume(job, len(data))
+                # Drop whatever preallocated space the stream didn't use
+                out.truncate()
+        finally:
+            BANDWIDTH_MANAGER.unregister(job)
+            for task in window:
+                task.cancel()
+            if out is not None and manifest['completed']:
+                # Stopped or failed part-way: record exactly what made it to disk
+                out.close()
+                self.save_manifest(ts_file, manifest)
+        return True
+
+COOKIE_DIR = None
+
+def cookie_dir():
+    """Per-process folder for the finders' cookie files; removed when the process exits."""
+    global COOKIE_DIR
+    if COOKIE_DIR is None:
+        COOKIE_DIR = tempfile.mkdtemp(prefix="m3u8_cookies_")
+        atexit.register(shutil.rmtree, COOKIE_DIR, True)
+    return COOKIE_DIR
+
 class MasterM3U8Finder:
     """
     Main class responsible for:
-    1. Launching a browser (Playwright).
+    1. Borrowing a warm browser from the BrowserPool (Playwright).
     2. Intercepting network requests to find 'master.m3u8'.
     3. Handling iframes and clicking play buttons to trigger streams.
     4. Downloading the stream using yt-dlp.
@@ -179,8 +1919,95 @@ class MasterM3U8Finder:
         self.master_url = None
         self.candidates = []
         self.bad_candidates = set()
+        # Set whenever a new candidate arrives; wakes the hunting loop (created per hunt)
+        self.candidate_event = None
+        # When the first candidate of this hunt showed up (for the 'discovery' timing span)
+        self.first_candidate_at = None
+        # Playlist text from each successful probe: url -> (text, truncated)
+        self.probes = {}
+        # Variants of the verified master playlist, and its full text if the probe got all of it
+        self.variants = []
+        self.master_text = None
         self.title = "Unknown"
-        
+        # --limit-rate the last yt-dlp run used (bytes/s), for the manual retry command
+        self.last_rate = None
+        # One cookie file per finder so concurrent captures don't overwrite each other
+        self.cookie_file = os.path.join(cookie_dir(), f"cookies_{uuid.uuid4().hex[:8]}.txt")
+
+    def discard_cookies(self):
+        if os.path.exists(self.cookie_file):
+            try:
+                os.remove(self.cookie_file)
+            except OSError:
+                pass
+
+    def add_candidate(self, url):
+        """Records a possible master URL and wakes the hunting loop. Returns False if already known."""
+        if url in self.candidates:
+            return False
+        if not self.candidates:
+            self.first_candidate_at = time.monotonic()
+        self.candidates.append(url)
+        if self.candidate_event:
+            self.candidate_event.set()
+        return True
+
+    async def scan_frames(self, page):
+        """Asks the in-page extractor of every frame for the m3u8 URLs in its current DOM."""
+        found = []
+        for frame in page.frames:
+            try:
+                found.extend(await frame.evaluate("() => window.__m3u8Rescan ? window.__m3u8Rescan() : []"))
+            except:
+                pass
+        return found
+
+    async def _every(self, interval, action, immediately=False):
+        """Runs 'action' every 'interval' seconds until cancelled, ignoring its errors."""
+        if not immediately:
+            await asyncio.sleep(interval)
+        while True:
+            try:
+                await action()
+            except asyncio.CancelledError:
+                raise
+            except:
+                pass
+            await asyncio.sleep(interval)
+
+    async def _wait_for_master(self, context, timeout, timers=()):
+        """
+        Waits until a candidate verifies or 'timeout' seconds pass.
+        - New candidates wake verification immediately through candidate_event.
+        - 'timers' are (interval, action, immediately) tuples run alongside,
+          e.g. wake-up clicks and DOM scans; they stop as soon as we return.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        tasks = [asyncio.create_task(self._every(*timer)) for timer in timers]
+        try:
+            while not self.master_url:
+                check_stop()
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                if not self.candidate_event.is_set():
+                    try:
+                        # Short timeout only so a Stop press is noticed promptly
+                        await asyncio.wait_for(self.candidate_event.wait(), timeout=min(0.5, remaining))
+                    except asyncio.TimeoutError:
+                        continue
+                self.candidate_event.clear()
+                with span('verify'):
+                    verified = await self.get_working_url(context)
+                if verified:
+                    self.master_url = verified
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.master_url
+
     def find_ytdlp(self):
         """Check if yt-dlp exists in common locations"""
         for name in ["yt-dlp.exe", "yt-dlp"]:
@@ -255,7 +2082,7 @@ class MasterM3U8Finder:
     async def save_cookies(self, context):
         """Save session cookies to Netscape format for yt-dlp"""
         try:
-            cookie_file = os.path.join(get_base_dir(), 'cookies.txt')
+            cookie_file = self.cookie_file
             cookies = await context.cookies()
             with open(cookie_file, 'w', encoding='utf-8') as f:
                 f.write("# Netscape HTTP Cookie File\n")
@@ -271,6 +2098,74 @@ class MasterM3U8Finder:
         except Exception as e:
             log(f"   ⚠️ Failed to save cookies: {e}")
 
+    def record_variants(self, url):
+        """Keeps the variant list from the verified URL's probe so the downloader can skip a refetch."""
+        text, truncated = self.probes.get(url, (None, True))
+        if text is None:
+            return
+        self.variants = m3u8_parser.parse_master(text, url).variants
+        self.master_text = None if truncated else text
+        if self.variants:
+            listing = ", ".join(f"{v.resolution}@{v.bandwidth // 1000}k" for v in sorted(self.variants, key=lambda v: -v.bandwidth))
+            log(f"   🎚️  {len(self.variants)} variant(s): {listing[:120]}")
+
+    async def fetch_playlist(self, url):
+        """Playlist text for url (reusing the verified master when we have all of it), or None."""
+        text = self.master_text if url == self.master_url else None
+        if not text:
+            def fetch():
+                session = requests.Session()
+                session.headers.update({"User-Agent": USER_AGENT})
+                try:
+                    response = session.get(url, timeout=10)
+                    return response.text if response.ok else None
+                finally:
+                    session.close()
+            try:
+                text = await asyncio.get_running_loop().run_in_executor(None, fetch)
+            except Exception:
+                text = None
+        return text if text and m3u8_parser.is_playlist(text) else None
+
+    async def estimate_download_size(self, master_url):
+        """Expected bytes for the variant the config policy picks (0 if the playlists don't say)."""
+        text = await self.fetch_playlist(master_url)
+        if not text:
+            return 0
+        master = m3u8_parser.parse_master(text, master_url)
+        variant = m3u8_parser.select_variant(master.variants, **variant_policy())
+        if not variant or not variant.bandwidth:
+            return 0
+        media_text = await self.fetch_playlist(variant.uri)
+        if not media_text:
+            return 0
+        return estimate_stream_bytes(variant, m3u8_parser.parse_media(media_text, variant.uri).duration)
+
+    async def choose_ytdlp_target(self, master_url):
+        """
+        Applies the variant policy for yt-dlp. Returns (url, format selector or None):
+        - No policy configured: the master URL, letting yt-dlp pick the best.
+        - A variant with muxed audio and no subtitle renditions: its media playlist URL.
+        - Otherwise: the master URL plus a -f selector for the chosen height.
+        """
+        policy = variant_policy()
+        if not any(policy.values()):
+            return master_url, None
+        text = await self.fetch_playlist(master_url)
+        if not text:
+            return master_url, None
+        master = m3u8_parser.parse_master(text, master_url)
+        variant = m3u8_parser.select_variant(master.variants, **policy)
+        if not variant:
+            return master_url, None
+        log(f"   🎚️  Selected variant: {variant.resolution} @ {variant.bandwidth // 1000} kbps (of {len(master.variants)})")
+        if not master.has_separate_audio(variant) and not variant.subtitles:
+            return variant.uri, None
+        if not variant.height:
+            return master_url, None
+        h = variant.height
+        return master_url, f"bv*[height={h}]+ba/b[height={h}]/bv*[height<={h}]+ba/b[height<={h}]/b"
+
     async def get_working_url(self, context):
         """Test all new candidates in parallel and return the first working one."""
         new_candidates = [u for u in self.candidates if u not in self.bad_candidates and u != self.master_url]
@@ -282,10 +2177,15 @@ class MasterM3U8Finder:
                 self.bad_candidates.add(url)
                 return None
             try:
-                # 2s timeout for fast rejection
-                response = await context.request.get(url, timeout=2000)
+                # 2s timeout for fast rejection; only the first few KB are needed
+                response = await context.request.get(url, timeout=2000, headers=probe_range_header())
                 if response.ok:
-                    return url
+                    truncated = probe_truncated(response.status, response.headers)
+                    text = sniff_playlist(await response.body(), truncated)
+                    if text is not None:
+                        self.probes[url] = (text, truncated)
+                        return url
+                    log(f"   ⚠️ Not a playlist (HTML or error page): {url[:80]}")
                 self.bad_candidates.add(url)
             except:
                 self.bad_candidates.add(url)
@@ -297,6 +2197,7 @@ class MasterM3U8Finder:
         for r in results:
             if r:
                 log(f"   ✅ Verified working: {r[:80]}")
+                self.record_variants(r)
                 return r
         
         return self.master_url if self.master_url else None
@@ -310,6 +2211,19 @@ class MasterM3U8Finder:
         check_stop()
         if not output_file.endswith('.mkv'):
             output_file += '.mkv'
+
+        target_url, format_spec = await self.choose_ytdlp_target(master_url)
+        host = urllib.parse.urlparse(target_url).hostname or ""
+        if CONFIG.get('adaptive_rate', True):
+            host_rate = get_rate_controller().rate_for(host)
+        else:
+            host_rate = parse_rate(self.download_speed if hasattr(self, 'download_speed') else DOWNLOAD_SPEED)
+        # yt-dlp can't be throttled mid-run, so it takes its fair share of the global budget up front
+        bandwidth_job = BANDWIDTH_MANAGER.register(host, host_rate, fixed=True)
+        rate = BANDWIDTH_MANAGER.share(bandwidth_job)
+        self.last_rate = rate
+        # 429s / fragment retries seen in yt-dlp's output, plus the last reported speed
+        stats = {'throttled': 0, 'speed': None}
         
         # Base arguments with Cloudflare bypass
         cmd = [
@@ -320,7 +2234,7 @@ class MasterM3U8Finder:
             '--fragment-retries', '10',
             '--retry-sleep', 'fragment:5',
             '--hls-prefer-native',
-            '--limit-rate', self.download_speed if hasattr(self, 'download_speed') else DOWNLOAD_SPEED,
+            *(['--limit-rate', format_rate(rate)] if rate else []),
             '--write-subs',
             '--all-subs',
             '--sub-langs', CONFIG['subtitle_langs'] if 'CONFIG' in globals() and 'subtitle_langs' in CONFIG else 'all',
@@ -332,12 +2246,14 @@ class MasterM3U8Finder:
         # Optional: Use cookies from browser if available (helps with some sites)
         if use_cookies:
             cmd.extend(['--user-agent', USER_AGENT])
-            cookie_file = os.path.join(get_base_dir(), 'cookies.txt')
+            cookie_file = self.cookie_file
             if os.path.exists(cookie_file):
                 log("   🍪 Using captured browser cookies...")
                 cmd.extend(['--cookies', cookie_file])
         
-        cmd.append(master_url)
+        if format_spec:
+            cmd.extend(['-f', format_spec])
+        cmd.append(target_url)
         
         # Check if we need to capture output for GUI
         capture_output = (LOG_CALLBACK is not None)
@@ -348,6 +2264,7 @@ class MasterM3U8Finder:
         log(f"\n⬇️  Starting download with yt-dlp...")
         log(f"   Output: {output_file}")
         log(f"   Anti-bot: Enabled")
+        log(f"   Rate limit: {format_rate(rate) + '/s' if rate else 'Unlimited'}")
         # log(f"   DEBUG Command: {cmd}")
         
         try:
@@ -367,6 +2284,7 @@ class MasterM3U8Finder:
                         if not line: break
                         text = line.decode('utf-8', errors='replace').strip()
                         if text:
+                            self._scan_ytdlp_output(text, stats)
                             if '[download]' in text and 'ETA' in text:
                                 match = re.search(r'(\d+\.?\d*)%', text)
                                 if match:
@@ -375,6 +2293,10 @@ class MasterM3U8Finder:
                                 pass
                             elif "Downloading fragment" in text:
                                 pass
+                            elif text.startswith("ERROR:"):
+                                log(text, level="error")
+                            elif text.startswith("WARNING:"):
+                                log(text, level="warning")
                             else:
                                 log(text)
                     except asyncio.TimeoutError:
@@ -383,15 +2305,28 @@ class MasterM3U8Finder:
                 
                 await process.wait()
             else:
-                process = await asyncio.create_subprocess_exec(*cmd, creationflags=creation_flags)
+                # Pipe stdout through to the console unchanged (progress bar included)
+                # so 429s can be spotted without changing what the user sees.
+                process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, creationflags=creation_flags)
                 try:
                     # Poll for stop signal while waiting for process
-                    while process.returncode is None:
+                    partial = ""
+                    while True:
                         check_stop()
                         try:
-                            await asyncio.wait_for(process.wait(), timeout=0.5)
+                            chunk = await asyncio.wait_for(process.stdout.read(4096), timeout=0.5)
                         except asyncio.TimeoutError:
                             continue
+                        if not chunk:
+                            break
+                        text = chunk.decode('utf-8', errors='replace')
+                        sys.stdout.write(text)
+                        sys.stdout.flush()
+                        parts = re.split(r'[\r\n]', partial + text)
+                        partial = parts.pop()
+                        for part in parts:
+                            self._scan_ytdlp_output(part, stats)
+                    await process.wait()
                     
                     # Check return code after wait
                     if process.returncode != 0 and process.returncode is not None:
@@ -410,6 +2345,11 @@ class MasterM3U8Finder:
                     await process.wait()
                     raise
 
+            if CONFIG.get('adaptive_rate', True):
+                if stats['throttled']:
+                    log(f"   ⚠️ Server throttled {stats['throttled']} request(s) during this download.")
+                    get_rate_controller().on_throttle(host, current=host_rate, observed=stats['speed'])
+
             if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
                 report_status(f"{status_prefix}Downloading 100.0%")
                 log(f"\n✅ Download complete: {output_file}")
@@ -422,10 +2362,24 @@ class MasterM3U8Finder:
         except Exception as e:
             log(f"\n❌ Error running yt-dlp: {e}")
             return False
+        finally:
+            BANDWIDTH_MANAGER.unregister(bandwidth_job)
+
+    def _scan_ytdlp_output(self, text, stats):
+        """Collect throttling signals and the current speed from one line of yt-dlp output."""
+        if "HTTP Error 429" in text or "Too Many Requests" in text or \
+           ("fragment" in text.lower() and ("Retrying" in text or "Skipping" in text)):
+            stats['throttled'] += 1
+            METRICS.add_throttled()
+        match = re.search(r'at\s+(\d+(?:\.\d+)?)\s*([KMG]i?B)/s', text)
+        if match:
+            stats['speed'] = parse_rate(match.group(1) + match.group(2)[0])
+            METRICS.set_speed(current_job_key(), stats['speed'])
 
     async def capture(self, start_url, headless=False):
         """
         The core logic:
+        - Borrows a warm browser context from the pool.
         - Opens the URL.
         - Listens for network traffic matching .m3u8.
         - Scans iframes if not found immediately.
@@ -436,341 +2390,320 @@ class MasterM3U8Finder:
         log(f"🔍 Hunting for master.m3u8 at: {start_url}")
         mode = "hidden" if headless else "visible"
         log(f"🖥️  Browser mode: {mode}\n")
+
+        pool = get_browser_pool()
+        with span('browser'):
+            slot = await pool.acquire(headless)
+        context = slot.context
+        METRICS.capture_started()
+
+        # Use a lightweight event listener instead of route interception.
+        # context.on('request') fires for ALL requests across every page,
+        # sub-iframe and popup in the session — without intercepting or
+        # slowing them down. This catches m3u8 URLs from nested iframes.
+        def on_request(request):
+            url = request.url
+            if 'master.m3u8' in url.lower() and self.add_candidate(url):
+                log(f"   🔎 Candidate found: {url[:80]}")
+
+        # The in-page extractor also finds URLs hidden in inline scripts and XHR/fetch bodies
+        def on_candidate(url):
+            if 'master.m3u8' in url.lower() and self.add_candidate(url):
+                log(f"   🔎 Candidate found in page: {url[:80]}")
+
+        context.on("request", on_request)
+        slot.on_candidate = on_candidate
+        discard = False
+        try:
+            return await self._hunt(context, slot.page, start_url, headless)
+        except BaseException:
+            # The context may be half-navigated or crashed; don't hand it to the next item
+            discard = True
+            raise
+        finally:
+            METRICS.capture_finished()
+            slot.on_candidate = None
+            try:
+                context.remove_listener("request", on_request)
+            except Exception:
+                pass
+            await pool.release(slot, discard=discard)
+
+    async def _hunt(self, context, page, start_url, headless):
+        """Runs the hunting steps on a borrowed context. Never closes the context."""
+        log("Step 1: Hunting for master.m3u8...")
+        # Optimization: Load page concurrently with proactive link sniffing and interaction.
+        hunt_start = time.monotonic()
+        goto_task = asyncio.create_task(page.goto(start_url, wait_until="commit", timeout=60000))
+        goto_done = []
+        goto_task.add_done_callback(lambda task: goto_done.append(time.monotonic()))
+        self.first_candidate_at = None
         
-        # Use a persistent user data directory to save cookies/session
-        # Use get_base_dir() so the session folder lives next to the .exe, not in CWD
-        user_data_dir = os.path.join(get_base_dir(), "browser_session")
-        if not os.path.exists(user_data_dir):
-            os.makedirs(user_data_dir)
-
-        # Ensure browsers are downloaded before launching
-        ensure_playwright_browsers()
-
-        async with async_playwright() as p:
-            if sys.platform.startswith('linux'):
-                # Use Firefox on Linux — different TLS/browser fingerprint bypasses
-                # Cloudflare bot detection that blocks Chromium headless on Linux.
-                # Windows/Mac continue to use Chromium (proven working, unchanged).
-                context = await p.firefox.launch_persistent_context(
-                    user_data_dir,
-                    headless=headless,
-                    user_agent=USER_AGENT,
-                    firefox_user_prefs={
-                        # Block JS popup windows
-                        "dom.popup_allowed_events": "",
-                        "dom.disable_open_during_load": True,
-                        # Suppress alerts/confirms/prompts
-                        "dom.disable_beforeunload": True,
-                        # Allow autoplay so the video starts without a click
-                        "media.autoplay.default": 0,
-                        "media.autoplay.blocking_policy": 0,
-                        # Force all popup windows into tabs (easier to close)
-                        "browser.link.open_newwindow": 3,
-                        "browser.link.open_newwindow.restriction": 0,
-                    }
-                )
+        # Event-driven hunt: candidates from on_request wake verification at once,
+        # while wake-up clicks and HTML scans run on their own timers.
+        self.candidate_event = asyncio.Event()
+        if self.candidates:
+            self.candidate_event.set()
 
-                # Auto-close any ad popups or new tabs that open
-                def _close_extra_page(new_page):
-                    asyncio.ensure_future(new_page.close())
-                context.on("page", _close_extra_page)
-            else:
-                # Chromium for Windows / Mac — proven working, unchanged
-                context = await p.chromium.launch_persistent_context(
-                    user_data_dir,
-                    headless=headless,
-                    viewport=None if not headless else {'width': 1280, 'height': 720},
-                    user_agent=USER_AGENT,
-                    bypass_csp=True,
-                    args=[
-                        '--disable-web-security',
-                        '--disable-features=IsolateOrigins,site-per-process',
-                        '--autoplay-policy=no-user-gesture-required',
-                        '--disable-blink-features=AutomationControlled',
-                        # Only minimize in headless mode. In visible mode, a minimized window
-                        # prevents Cloudflare from completing its JS challenge → about:blank
-                        *(['--start-minimized'] if headless else []),
-                        '--disable-backgrounding-occluded-windows',
-                        '--disable-renderer-backgrounding',
-                        '--disable-background-timer-throttling',
-                    ],
-                    ignore_default_args=["--enable-automation"]
-                )
-            
-            page = context.pages[0] if context.pages else await context.new_page()
+        async def wake_click():
+            # Click the main body and any found iframes to trigger JS links
+            await page.evaluate("() => document.body.click()")
+            iframes = page.locator('iframe')
+            count = await iframes.count()
+            for i in range(count):
+                try:
+                    await iframes.nth(i).click(timeout=100)
+                except:
+                    pass
 
-            # Optimzed Ad-blocking: Block images/media natively, and only check scripts for ads
-            ad_regex = re.compile(r'googlesyndication|doubleclick|adnxs|ads-twitter|facebook|quantserve|taboola|outbrain|advertising|mathtag|dtscout|amazon-adsystem', re.IGNORECASE)
-            
-            async def block_junk(route):
-                request = route.request
-                if request.resource_type in ["image", "media", "font"]:
-                    return await route.abort()
-                
-                url = request.url.lower()
-                if "unpkg.com" in url or ad_regex.search(url):
-                    return await route.abort()
-                
-                await route.continue_()
-            
-            await context.route("**/*", block_junk)
-
-            # Use a lightweight event listener instead of route interception.
-            # context.on('request') fires for ALL requests across every page,
-            # sub-iframe and popup in the session — without intercepting or
-            # slowing them down. This catches m3u8 URLs from nested iframes.
-            def on_request(request):
-                url = request.url
-                if 'master.m3u8' in url.lower() and url not in self.candidates:
-                    log(f"   🔎 Candidate found: {url[:80]}")
-                    self.candidates.append(url)
-
-            context.on("request", on_request)
-
-            # Inject safe stealth overrides. Only the 4 known-safe properties —
-            # permissions.query and navigator.platform overrides were found to
-            # interfere with cloudnestra's player JavaScript on Windows.
-            await page.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', { get: () => undefined });
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [
-                        { name: 'Chrome PDF Plugin' },
-                        { name: 'Chrome PDF Viewer' },
-                        { name: 'Native Client' }
+        async def rescan_frames():
+            # Safety net for frames that loaded before the extractor could observe them
+            for match in await self.scan_frames(page):
+                if 'master.m3u8' in match.lower():
+                    self.add_candidate(match)
+
+        await self._wait_for_master(context, 60, timers=[(1, wake_click), (5, rescan_frames)])
+
+        # Cleanup navigation task
+        if not goto_task.done():
+            goto_task.cancel()
+        elif goto_done:
+            record_span('goto', goto_done[0] - hunt_start)
+        if self.first_candidate_at:
+            record_span('discovery', self.first_candidate_at - hunt_start)
+
+        if self.master_url:
+            if self.title == "Unknown":
+                self.title = await self.extract_title(page)
+            log(f"   ⚡ Master URL found! Finalizing...")
+            await self.save_cookies(context)
+            return self.master_url, self.title, start_url, "success"
+        
+        self.title = await self.extract_title(page)
+        title_found = True
+        log(f"📝 Page Title: {self.title}")
+        
+        if "404" in self.title or "Not Found" in self.title:
+            log("   ❌ 404 Not Found detected.")
+            return None, self.title, start_url, "404"
+        
+        await asyncio.sleep(1)
+        
+        log("Step 2: Scanning for video iframes...")
+        frames = page.frames
+        iframe_urls = []
+        
+        for frame in frames:
+            check_stop()
+            try:
+                url = frame.url
+                if url and url != start_url and 'about:blank' not in url:
+                    # Skip known bot/captcha/tracking/ad domains
+                    # Firefox doesn't block these by default, so they show as iframes
+                    skip_domains = [
+                        'cloudflare', 'turnstile', 'recaptcha',
+                        'dtscout.com', 'lijit.com', 'sharethis.com',
+                        'crwdcntrl.net', 'intentiq.com', 'doubleclick.net',
+                        'googlesyndication.com', 'amazon-adsystem.com',
+                        'facebook.com/tr', 'google-analytics.com',
+                        'scorecardresearch.com', 'quantserve.com',
+                        'adnxs.com', 'rubiconproject.com', 'pubmatic.com',
                     ]
-                });
-                Object.defineProperty(navigator, 'languages', { get: () => ['en-US', 'en'] });
-                window.chrome = { runtime: {} };
+                    if any(x in url.lower() for x in skip_domains):
+                        continue
 
-                // Fix HeadlessChrome in userAgent without recursion (Linux headless)
-                try {
-                    const _origUA = Object.getOwnPropertyDescriptor(Navigator.prototype, 'userAgent').get.call(navigator);
-                    Object.defineProperty(navigator, 'userAgent', {
-                        get: () => _origUA.replace('HeadlessChrome', 'Chrome')
-                    });
-                } catch(e) {}
-            """)
-            
-            log("Step 1: Hunting for master.m3u8...")
-            # Optimization: Load page concurrently with proactive link sniffing and interaction.
-            goto_task = asyncio.create_task(page.goto(start_url, wait_until="commit", timeout=60000))
-            
-            # Unified Hunting Loop: Polling, Clicking, and Iframe scanning all at once.
-            self._verify_in_progress = False
-            
-            for tick in range(600): # Max 60s total hunting
+                    # Only keep iframes that look like video embeds
+                    video_patterns = [
+                        'cloudnestra', 'vidsrc', '/embed/', '/rcp/', '/prorcp/',
+                        'streamtape', 'doodstream', 'filemoon', 'mixdrop',
+                        'upstream', 'vidplay', 'mycloud', 'mp4upload',
+                    ]
+                    if not any(x in url.lower() for x in video_patterns):
+                        continue
+
+                    log(f"   Found iframe: {url[:80]}")
+                    iframe_urls.append(url)
+            except:
+                pass
+        
+        iframes_start = time.monotonic()
+        if not self.master_url and iframe_urls:
+            log(f"\nStep 3: Checking {len(iframe_urls)} iframe(s)...")
+
+            if len(iframe_urls) > 1:
+                if headless:
+                    log(f"⚠️  Multiple sources detected ({len(iframe_urls)}) in headless mode. Switching to visible...")
+                    return None, self.title, start_url, "retry"
+
+                log(f"\n⚠️  Multiple sources detected ({len(iframe_urls)}). Needs human input.")
+                for i, url in enumerate(iframe_urls):
+                    log(f"   {i+1}: {url}")
+
+                choice = get_user_input(f"\nSelect source (1-{len(iframe_urls)}) or Press Enter to scan all: ").strip()
+                if choice.isdigit():
+                    idx = int(choice) - 1
+                    if 0 <= idx < len(iframe_urls):
+                        iframe_urls = [iframe_urls[idx]]
+                        log(f"   ✅ Selected: {iframe_urls[0]}")
+
+            for iframe_url in iframe_urls:
                 check_stop()
-                
-                # 1. Parallel verification of network candidates
-                if not self._verify_in_progress:
-                    new_candidates = [u for u in self.candidates if u not in self.bad_candidates and u != self.master_url]
-                    if new_candidates:
-                        self._verify_in_progress = True
-                        try:
-                            # Use a helper task to verify in background
-                            async def run_verify():
-                                try:
-                                    res = await self.get_working_url(context)
-                                    if res:
-                                        self.master_url = res
-                                finally:
-                                    self._verify_in_progress = False
-                            asyncio.create_task(run_verify())
-                        except:
-                            self._verify_in_progress = False
-                
                 if self.master_url:
                     break
 
-                # 2. Proactive "Wake-up" clicks (Every 1s) to trigger JS links
-                if tick > 0 and tick % 10 == 0:
-                    try:
-                        # Click the main body and any found iframes
-                        await page.evaluate("() => document.body.click()")
-                        iframes = page.locator('iframe')
-                        count = await iframes.count()
-                        for i in range(count):
-                            await iframes.nth(i).click(timeout=100)
-                    except:
-                        pass
+                log(f"   Navigating to: {iframe_url[:80]}...")
+                try:
+                    await page.set_extra_http_headers({'Referer': start_url})
+                    timeout = 10000 if headless else 15000
+                    await page.goto(iframe_url, wait_until="domcontentloaded", timeout=timeout)
+
+                    if headless and self.master_url:
+                        break
 
-                # 3. Check for late-discovered candidates in HTML
-                if tick % 30 == 0:
+                    iframe_title = await self.extract_title(page)
+                    if iframe_title != "Unknown" and self.title == "Unknown":
+                        self.title = iframe_title
+                        log(f"   📝 Iframe Title: {self.title}")
+
+                    # JS evaluate click — primary method (works on Windows + non-Linux)
                     try:
-                        content = await page.content()
-                        matches = re.findall(r'https?://[^\s"\']+master\.m3u8[^\s"\']*', content, re.IGNORECASE)
-                        for match in matches:
-                            if match not in self.candidates:
-                                self.candidates.append(match)
+                        await page.evaluate("""() => {
+                            const video = document.querySelector('video');
+                            if (video) { video.muted = true; video.play().catch(e => {}); }
+                            const btn = document.querySelector('.vjs-big-play-button, .play-button, [class*="play"]');
+                            if (btn) btn.click();
+                        }""")
                     except:
                         pass
-                
-                await asyncio.sleep(0.1)
-
-            # Cleanup navigation task
-            if not goto_task.done():
-                goto_task.cancel()
-
-            if self.master_url:
-                if self.title == "Unknown":
-                    self.title = await self.extract_title(page)
-                log(f"   ⚡ Master URL found! Finalizing...")
-                await self.save_cookies(context)
-                await context.close()
-                return self.master_url, self.title, start_url, "success"
-            
-            self.title = await self.extract_title(page)
-            title_found = True
-            log(f"📝 Page Title: {self.title}")
-            
-            if "404" in self.title or "Not Found" in self.title:
-                log("   ❌ 404 Not Found detected.")
-                await context.close()
-                return None, self.title, start_url, "404"
-            
-            await asyncio.sleep(1)
-            
-            log("Step 2: Scanning for video iframes...")
-            frames = page.frames
-            iframe_urls = []
-            
-            for frame in frames:
-                check_stop()
-                try:
-                    url = frame.url
-                    if url and url != start_url and 'about:blank' not in url:
-                        # Skip known bot/captcha/tracking/ad domains
-                        # Firefox doesn't block these by default, so they show as iframes
-                        skip_domains = [
-                            'cloudflare', 'turnstile', 'recaptcha',
-                            'dtscout.com', 'lijit.com', 'sharethis.com',
-                            'crwdcntrl.net', 'intentiq.com', 'doubleclick.net',
-                            'googlesyndication.com', 'amazon-adsystem.com',
-                            'facebook.com/tr', 'google-analytics.com',
-                            'scorecardresearch.com', 'quantserve.com',
-                            'adnxs.com', 'rubiconproject.com', 'pubmatic.com',
-                        ]
-                        if any(x in url.lower() for x in skip_domains):
-                            continue
 
-                        # Only keep iframes that look like video embeds
-                        video_patterns = [
-                            'cloudnestra', 'vidsrc', '/embed/', '/rcp/', '/prorcp/',
-                            'streamtape', 'doodstream', 'filemoon', 'mixdrop',
-                            'upstream', 'vidplay', 'mycloud', 'mp4upload',
-                        ]
-                        if not any(x in url.lower() for x in video_patterns):
+                    # Also try Playwright native click
+                    play_selectors = [
+                        '.vjs-big-play-button', '.play-button',
+                        'button[class*="play"]', '[class*="play"][role="button"]', 'video',
+                    ]
+                    for sel in play_selectors:
+                        try:
+                            if await page.locator(sel).count() > 0:
+                                await page.locator(sel).first.click(timeout=1000)
+                                break
+                        except:
                             continue
 
-                        log(f"   Found iframe: {url[:80]}")
-                        iframe_urls.append(url)
-                except:
-                    pass
-            
-            if not self.master_url and iframe_urls:
-                log(f"\nStep 3: Checking {len(iframe_urls)} iframe(s)...")
-
-                if len(iframe_urls) > 1:
                     if headless:
-                        log(f"⚠️  Multiple sources detected ({len(iframe_urls)}) in headless mode. Switching to visible...")
-                        await context.close()
-                        return None, self.title, start_url, "retry"
-
-                    log(f"\n⚠️  Multiple sources detected ({len(iframe_urls)}). Needs human input.")
-                    for i, url in enumerate(iframe_urls):
-                        log(f"   {i+1}: {url}")
-
-                    choice = get_user_input(f"\nSelect source (1-{len(iframe_urls)}) or Press Enter to scan all: ").strip()
-                    if choice.isdigit():
-                        idx = int(choice) - 1
-                        if 0 <= idx < len(iframe_urls):
-                            iframe_urls = [iframe_urls[idx]]
-                            log(f"   ✅ Selected: {iframe_urls[0]}")
-
-                for iframe_url in iframe_urls:
-                    check_stop()
-                    if self.master_url:
-                        break
-
-                    log(f"   Navigating to: {iframe_url[:80]}...")
-                    try:
-                        await page.set_extra_http_headers({'Referer': start_url})
-                        timeout = 10000 if headless else 15000
-                        await page.goto(iframe_url, wait_until="domcontentloaded", timeout=timeout)
-
-                        if headless and self.master_url:
-                            break
-
-                        iframe_title = await self.extract_title(page)
-                        if iframe_title != "Unknown" and self.title == "Unknown":
-                            self.title = iframe_title
-                            log(f"   📝 Iframe Title: {self.title}")
-
-                        # JS evaluate click — primary method (works on Windows + non-Linux)
-                        try:
+                        async def nudge_play():
                             await page.evaluate("""() => {
                                 const video = document.querySelector('video');
-                                if (video) { video.muted = true; video.play().catch(e => {}); }
+                                if (video) { video.muted = true; video.play().catch(()=>{}); }
                                 const btn = document.querySelector('.vjs-big-play-button, .play-button, [class*="play"]');
                                 if (btn) btn.click();
                             }""")
-                        except:
-                            pass
-
-                        # Also try Playwright native click
-                        play_selectors = [
-                            '.vjs-big-play-button', '.play-button',
-                            'button[class*="play"]', '[class*="play"][role="button"]', 'video',
-                        ]
-                        for sel in play_selectors:
-                            try:
-                                if await page.locator(sel).count() > 0:
-                                    await page.locator(sel).first.click(timeout=1000)
-                                    break
-                            except:
-                                continue
-
-                        if headless:
-                            for tick in range(150):  # Max 15s wait, check every 0.1s
-                                verified = await self.get_working_url(context)
-                                if verified:
-                                    self.master_url = verified
-                                    break
-                                if tick > 0 and tick % 30 == 0:
-                                    try:
-                                        await page.evaluate("""() => {
-                                            const video = document.querySelector('video');
-                                            if (video) { video.muted = true; video.play().catch(()=>{}); }
-                                            const btn = document.querySelector('.vjs-big-play-button, .play-button, [class*="play"]');
-                                            if (btn) btn.click();
-                                        }""")
-                                    except:
-                                        pass
-                                await asyncio.sleep(0.1)
-                        else:
-                            await asyncio.sleep(5)
 
-                    except Exception as e:
-                        log(f"      Error: {str(e)[:60]}")
-                        continue
-            
-            if not self.master_url:
-                log("Step 4: Checking page source...")
-                content = await page.content()
-                matches = re.findall(r'https?://[^\s"\']+master\.m3u8[^\s"\']*', content, re.IGNORECASE)
-                for match in matches:
-                    if match not in self.candidates:
-                        log(f"   Found in HTML: {match}")
-                        self.candidates.append(match)
-                
-                verified = await self.get_working_url(context)
-                if verified:
-                    self.master_url = verified
-            
-            await self.save_cookies(context)
-            await context.close()
-            
-            return self.master_url, self.title, start_url, "success"
+                        # Max 15s wait; the iframe's requests wake us as soon as they arrive
+                        self.candidate_event.set()
+                        await self._wait_for_master(context, 15, timers=[(3, nudge_play)])
+                    else:
+                        await asyncio.sleep(5)
+
+                except Exception as e:
+                    log(f"      Error: {str(e)[:60]}", level="error")
+                    continue
+        
+        if iframe_urls:
+            record_span('iframes', time.monotonic() - iframes_start)
+
+        if not self.master_url:
+            log("Step 4: Checking page source...")
+            for match in await self.scan_frames(page):
+                if 'master.m3u8' in match.lower() and self.add_candidate(match):
+                    log(f"   Found in HTML: {match}")
+            
+            with span('verify'):
+                verified = await self.get_working_url(context)
+            if verified:
+                self.master_url = verified
+        
+        await self.save_cookies(context)
+        
+        return self.master_url, self.title, start_url, "success"
+
+    def find_ffmpeg(self):
+        """Check if ffmpeg exists next to the script or on PATH"""
+        for name in ["ffmpeg.exe", "ffmpeg"]:
+            path = os.path.join(get_base_dir(), name)
+            if os.path.exists(path):
+                return path
+        return shutil.which("ffmpeg") or shutil.which("ffmpeg.exe")
+
+    async def run_native(self, master_url, output_file, status_prefix=""):
+        """
+        Download with the built-in HLS engine.
+        Returns True/False, or None when the stream needs yt-dlp instead.
+        """
+        check_stop()
+        if not output_file.endswith('.mkv'):
+            output_file += '.mkv'
+
+        ffmpeg_path = self.find_ffmpeg()
+        if not ffmpeg_path:
+            log("   ⚠️ FFmpeg not found; the native engine needs it to write .mkv files.")
+            return None
+
+        ts_file = os.path.splitext(output_file)[0] + ".ts"
+        keep_partial = False
+        downloader = NativeHLSDownloader(
+            concurrency=CONFIG.get('segment_concurrency', 6),
+            retries=CONFIG.get('segment_retries', 5),
+            cookie_file=self.cookie_file,
+        )
+
+        report_status(f"{status_prefix}Downloading...")
+        log(f"\n⬇️  Starting download with native HLS engine...")
+        log(f"   Output: {output_file}")
+        try:
+            # Reuse the playlist fetched during verification when we have all of it
+            master_text = self.master_text if master_url == self.master_url else None
+            await downloader.download(master_url, ts_file, status_prefix=status_prefix, master_text=master_text)
+
+            set_phase('remux')
+            log("   🎞️  Remuxing segments to MKV...")
+            process = await asyncio.create_subprocess_exec(
+                ffmpeg_path, "-y", "-hide_banner", "-loglevel", "error",
+                "-i", ts_file, "-map", "0", "-c", "copy", output_file,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await process.communicate()
+            if process.returncode != 0:
+                log(f"   ❌ FFmpeg remux failed: {stderr.decode('utf-8', errors='replace').strip()[:200]}")
+                return False
+
+            if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
+                report_status(f"{status_prefix}Downloading 100.0%")
+                log(f"\n✅ Download complete: {output_file}")
+                size = os.path.getsize(output_file) / (1024*1024)
+                log(f"   File size: {size:.1f} MB")
+                return True
+            log(f"\n❌ Download failed (File not found).")
+            return False
+        except UnsupportedStream as e:
+            log(f"   ℹ️  Native engine can't handle this stream ({e}). Using yt-dlp.")
+            return None
+        except asyncio.CancelledError:
+            keep_partial = os.path.exists(NativeHLSDownloader.manifest_path(ts_file))
+            raise
+        except Exception as e:
+            # Interrupted mid-stream: keep the .ts and its manifest so the next run resumes
+            keep_partial = os.path.exists(NativeHLSDownloader.manifest_path(ts_file))
+            if "Stopped by user" in str(e):
+                raise
+            log(f"\n❌ Error in native HLS engine: {e}")
+            return False
+        finally:
+            downloader.close()
+            if keep_partial:
+                log(f"   💾 Partial download kept in {os.path.basename(ts_file)}; it will resume next time.")
+            else:
+                NativeHLSDownloader.discard_partial(ts_file)
 
     def set_download_speed(self, speed):
         self.download_speed = speed
@@ -813,28 +2746,103 @@ def get_output_paths(title, url):
         
     return final_dir, filename
 
-async def process_video(url, headless=True, auto_mode=True):
+def staging_dir_for(final_dir):
     """
-    Orchestrates the download process for a single URL:
+    Folder a download is written to before it is moved into final_dir:
+    - 'target' staging (default): '<final_dir>/.partial', on the same filesystem,
+      so the final move is an atomic rename instead of a second full copy.
+    - 'base' staging, or if that folder can't be created: temp_downloads next to the script.
+    """
+    if CONFIG.get('staging_mode', 'target') == 'target':
+        path = os.path.join(final_dir, ".partial")
+        try:
+            os.makedirs(path, exist_ok=True)
+            return path
+        except OSError as e:
+            log(f"   ⚠️ Could not create {path} ({e}). Using temp_downloads instead.")
+    path = os.path.join(get_base_dir(), "temp_downloads")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+async def run_blocking(func, *args):
+    """Runs a blocking call (ffmpeg, a cross-drive copy) on a worker thread, keeping the job's log context."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(None, ctx.run, func, *args)
+
+def place_file(src, dst):
+    """Moves a finished download into place: a rename when possible, a copy only across drives."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        log("   ℹ️  Destination is on another drive. Copying...")
+        if os.path.exists(dst):
+            os.remove(dst)
+        shutil.move(src, dst)
+
+def cleanup_staging_dir(path):
+    """Removes a '.partial' staging folder once nothing is left in it."""
+    if os.path.basename(path) != ".partial":
+        return
+    try:
+        os.rmdir(path)
+    except OSError:
+        pass
+
+class CaptureResult:
+    """What the hunt produced for one URL, handed from the capture stage to the download stage."""
+    def __init__(self, url, finder, master_url, title, status, cached=False):
+        self.url = url
+        self.finder = finder
+        self.master_url = master_url
+        self.title = title
+        self.status = status
+        self.cached = cached
+
+async def capture_video(url, headless=True, auto_mode=True):
+    """
+    Capture stage for a single URL:
     1. Converts IMDB URLs if needed.
-    2. Runs MasterM3U8Finder to get the stream.
-    3. Saves metadata to a .txt file.
-    4. Runs yt-dlp to download.
-    5. Moves the file to the final destination on success.
+    2. Reuses a recent capture of the same URL if its master URL still answers.
+    3. Otherwise runs MasterM3U8Finder to get the stream (retrying visible if headless fails).
     """
     check_stop()
+    set_phase('capture')
     report_status("Analyzing...")
-    if not url.startswith('http'):
-        url = 'https://' + url
-    
     # Check for IMDB URL and convert to vsembed
-    if "imdb.com/title/" in url:
-        match = re.search(r'(tt\d+)', url)
-        if match:
-            imdb_id = match.group(1)
-            log(f"\nℹ️  Detected IMDB URL. ID: {imdb_id}")
-            url = f"https://vsembed.ru/embed/movie?imdb={imdb_id}"
-            log(f"   Converted to: {url}")
+    embed_url = to_embed_url(url)
+    # embed_url also differs when only https:// was added, so check for an ID before reporting a conversion
+    imdb_match = re.search(r'(tt\d+)', url) if "imdb.com/title/" in url else None
+    if imdb_match:
+        log(f"\nℹ️  Detected IMDB URL. ID: {imdb_match.group(1)}")
+        log(f"   Converted to: {embed_url}")
+    url = embed_url
+
+    cache = get_capture_cache()
+    entry = cache.get(url)
+    if entry:
+        finder = MasterM3U8Finder()
+        if CONFIG.get('download_speed'):
+            finder.set_download_speed(CONFIG['download_speed'])
+        if entry.get('cookies'):
+            try:
+                with open(finder.cookie_file, 'w', encoding='utf-8') as f:
+                    f.write(entry['cookies'])
+            except:
+                pass
+        age = int(time.time() - entry['ts'])
+        log(f"♻️  Found a capture from {age // 60}m {age % 60}s ago. Re-checking it...")
+        loop = asyncio.get_running_loop()
+        with span('verify'):
+            still_valid = await loop.run_in_executor(None, CaptureCache.verify, entry['master_url'], finder.cookie_file)
+        if still_valid:
+            log(f"   ✅ Still working: {entry['master_url'][:80]}")
+            log_event('capture.end', 'success', status="success", cached=True, url=entry['master_url'])
+            return CaptureResult(url, finder, entry['master_url'], entry['title'], "success", cached=True)
+        log("   ⚠️ Cached stream no longer answers. Hunting again...")
+        cache.drop(url)
+        finder.discard_cookies()
 
     if not auto_mode:
         log("\nBrowser visibility options:")
@@ -848,9 +2856,58 @@ async def process_video(url, headless=True, auto_mode=True):
     if CONFIG.get('download_speed'):
         finder.set_download_speed(CONFIG['download_speed'])
         
-    master_url, title, referer, status = await finder.capture(url, headless=headless)
-    
-    if status == "404":
+    try:
+        master_url, title, referer, status = await finder.capture(url, headless=headless)
+    except BaseException:
+        finder.discard_cookies()
+        raise
+    if master_url:
+        cache.put(url, master_url, title, finder.cookie_file)
+
+    if not master_url and status != "404" and headless:
+        log("\n⚠️  Headless capture failed. Retrying in visible mode to bypass Cloudflare...")
+        finder.discard_cookies()
+        return await capture_video(url, headless=False, auto_mode=True)
+
+    log_event('capture.end', 'success' if master_url else 'error', status=status, cached=False, url=master_url)
+    return CaptureResult(url, finder, master_url, title, status)
+
+def release_capture(capture):
+    """Deletes what a capture left on disk (its cookie file) once the download stage is done with it."""
+    finder = getattr(capture, 'finder', None)
+    if finder is not None:
+        finder.discard_cookies()
+
+async def process_video(url, headless=True, auto_mode=True):
+    """
+    Orchestrates the download process for a single URL:
+    1. Captures the stream (capture_video).
+    2. Downloads and places it (download_video).
+    """
+    begin_job(url)
+    try:
+        capture = await capture_video(url, headless=headless, auto_mode=auto_mode)
+        try:
+            result = await download_video(capture, auto_mode=auto_mode)
+        finally:
+            release_capture(capture)
+    except Exception as e:
+        finish_job(e)
+        raise
+    finish_job(result)
+    return result
+
+async def download_video(capture, auto_mode=True):
+    """
+    Download stage for a captured URL:
+    1. Saves metadata to a .txt file.
+    2. Runs yt-dlp to download.
+    3. Moves the file to the final destination on success.
+    """
+    url, finder = capture.url, capture.finder
+    master_url, title = capture.master_url, capture.title
+
+    if capture.status == "404":
         log(f"❌ FAILED - 404 Not Found: {url}")
         return "404"
     
@@ -864,6 +2921,7 @@ async def process_video(url, headless=True, auto_mode=True):
         log(f"🔗 URL: {master_url[:80]}...")
         
         ytdlp_path = finder.find_ytdlp()
+        use_native = CONFIG.get('download_engine', 'ytdlp') == 'native'
         
         final_dir, filename = get_output_paths(title, url)
         os.makedirs(final_dir, exist_ok=True)
@@ -871,21 +2929,22 @@ async def process_video(url, headless=True, auto_mode=True):
         txt_filename = os.path.join(final_dir, f"{safe_title}.txt")
         final_filename = os.path.join(final_dir, filename)
             
-        # Setup Temp Directory
-        script_dir = get_base_dir()
-        temp_dir = os.path.join(script_dir, "temp_downloads")
-        os.makedirs(temp_dir, exist_ok=True)
+        # Setup Temp Directory (next to the destination, so finishing is a rename)
+        temp_dir = staging_dir_for(final_dir)
         temp_filename = os.path.join(temp_dir, f"{safe_title}.mkv")
             
         with open(txt_filename, 'w', encoding='utf-8') as f:
             f.write(f"Title: {title}\n")
             f.write(f"URL: {master_url}\n")
             f.write(f"Filename: {final_filename}\n")
-            f.write(f"Command: yt-dlp --ignore-errors --no-warnings --fixup detect_or_warn --fragment-retries 10 --retry-sleep fragment:5 --hls-prefer-native --limit-rate {CONFIG.get('download_speed', DOWNLOAD_SPEED)} --user-agent \"{USER_AGENT}\" -o \"{final_filename}\" \"{master_url}\"\n")
+            f.write(f"Command: {manual_ytdlp_command(final_filename, master_url)}\n")
         log(f"\n💾 Details saved to {txt_filename}")
         
-        if ytdlp_path:
-            log(f"\n🛠️  yt-dlp found: {ytdlp_path}")
+        if ytdlp_path or use_native:
+            if ytdlp_path:
+                log(f"\n🛠️  yt-dlp found: {ytdlp_path}")
+            if use_native:
+                log(f"\n🛠️  Download engine: native HLS")
             
             if os.path.exists(final_filename):
                 log(f"\n⚠️  File '{final_filename}' already exists.")
@@ -915,92 +2974,489 @@ async def process_video(url, headless=True, auto_mode=True):
                     e_num = int(e_match.group(1)) if e_match else 0
                     status_prefix = f"S{s_num:02d}E{e_num:02d} "
 
-                # Download to temp file first
-                success = await finder.run_ytdlp(ytdlp_path, master_url, temp_filename, status_prefix=status_prefix)
-                
-                if not success:
-                    log("\n⚠️  First attempt failed. Trying with browser cookies...")
-                    success = await finder.run_ytdlp(ytdlp_path, master_url, temp_filename, use_cookies=True, status_prefix=status_prefix)
+                # Fail fast if the download (and what plugins do with it) can't fit
+                reserved = await reserve_disk_space(finder, master_url, temp_filename, final_filename)
+                if reserved is None:
+                    return False
+                try:
+                    # Download to temp file first
+                    set_phase('download')
+                    success = None
+                    engine = 'native' if use_native else 'ytdlp'
+                    if use_native:
+                        success = await finder.run_native(master_url, temp_filename, status_prefix=status_prefix)
+                        if success is False and ytdlp_path:
+                            log("\n⚠️  Native engine failed. Falling back to yt-dlp...")
+
+                    if not success and ytdlp_path:
+                        engine = 'ytdlp'
+                        success = await finder.run_ytdlp(ytdlp_path, master_url, temp_filename, status_prefix=status_prefix)
+                    
+                        if not success:
+                            log("\n⚠️  First attempt failed. Trying with browser cookies...")
+                            success = await finder.run_ytdlp(ytdlp_path, master_url, temp_filename, use_cookies=True, status_prefix=status_prefix)
+                    success = bool(success)
+                    log_event('download.end', 'success' if success else 'error', engine=engine, url=master_url,
+                              bytes=os.path.getsize(temp_filename) if success and os.path.exists(temp_filename) else 0)
+                    if success:
+                        # Another engine may have finished what the native engine started
+                        NativeHLSDownloader.discard_partial(os.path.splitext(temp_filename)[0] + ".ts")
+                    if not success and capture.cached:
+                        # A verified-but-unusable cached stream: hunt fresh next time
+                        get_capture_cache().drop(url)
                 
-                cookie_file = os.path.join(get_base_dir(), 'cookies.txt')
-                if os.path.exists(cookie_file):
-                    try:
-                        os.remove(cookie_file)
-                    except:
-                        pass
+                    finder.discard_cookies()
                 
-                if success:
-                    # Run Plugins
-                    plugin_manager = PluginManager()
-                    new_temp_filename = plugin_manager.run_plugins(temp_filename)
+                    if success:
+                        # Run Plugins
+                        set_phase('plugins')
+                        plugin_manager = PluginManager()
+                        # Off the loop: ffmpeg can take minutes, and other captures/downloads keep running meanwhile
+                        new_temp_filename = await run_blocking(plugin_manager.run_plugins, temp_filename)
                     
-                    # Check if plugin moved the file out of temp_downloads
-                    # If the returned path is NOT in temp_dir, assume plugin handled the final move
-                    if not os.path.abspath(new_temp_filename).startswith(os.path.abspath(temp_dir)):
-                        log(f"\n✅ Plugin handled final move. File located at: {new_temp_filename}")
-                        # Cleanup txt file if it exists in the default location
-                        if os.path.exists(txt_filename):
+                        # Check if plugin moved the file out of temp_downloads
+                        # If the returned path is NOT in temp_dir, assume plugin handled the final move
+                        if not os.path.abspath(new_temp_filename).startswith(os.path.abspath(temp_dir)):
+                            log(f"\n✅ Plugin handled final move. File located at: {new_temp_filename}")
+                            get_library_index().forget(os.path.dirname(new_temp_filename))
+                            # Cleanup txt file if it exists in the default location
+                            if os.path.exists(txt_filename):
+                                try:
+                                    os.remove(txt_filename)
+                                except:
+                                    pass
+                            # Cleanup empty default directory if we created it and it's empty
+                            cleanup_staging_dir(temp_dir)
                             try:
-                                os.remove(txt_filename)
+                                if os.path.exists(final_dir) and not os.listdir(final_dir):
+                                    os.rmdir(final_dir)
                             except:
                                 pass
-                        # Cleanup empty default directory if we created it and it's empty
-                        try:
-                            if os.path.exists(final_dir) and not os.listdir(final_dir):
-                                os.rmdir(final_dir)
-                        except:
-                            pass
-                        return True
+                            return True
                     
-                    temp_filename = new_temp_filename
-                    # Update final filename extension if plugin changed it
-                    _, ext_temp = os.path.splitext(temp_filename)
-                    base_final, ext_final = os.path.splitext(final_filename)
-                    if ext_temp.lower() != ext_final.lower():
-                        final_filename = f"{base_final}{ext_temp}"
-
-                    log(f"\n🚚 Moving file to final destination...")
-                    log(f"   From: {temp_filename}")
-                    log(f"   To:   {final_filename}")
-                    try:
-                        if os.path.exists(final_filename):
-                            os.remove(final_filename)
-                        shutil.move(temp_filename, final_filename)
-                        log(f"✅ Move complete.")
+                        temp_filename = new_temp_filename
+                        # Update final filename extension if plugin changed it
+                        _, ext_temp = os.path.splitext(temp_filename)
+                        base_final, ext_final = os.path.splitext(final_filename)
+                        if ext_temp.lower() != ext_final.lower():
+                            final_filename = f"{base_final}{ext_temp}"
+
+                        set_phase('move')
+                        log(f"\n🚚 Moving file to final destination...")
+                        log(f"   From: {temp_filename}")
+                        log(f"   To:   {final_filename}")
+                        try:
+                            # A cross-drive copy can be slow; keep the other download workers streaming
+                            await run_blocking(place_file, temp_filename, final_filename)
+                            get_library_index().forget(os.path.dirname(final_filename))
+                            cleanup_staging_dir(temp_dir)
+                            log(f"✅ Move complete.")
                         
-                        if os.path.exists(txt_filename):
-                            try:
-                                os.remove(txt_filename)
-                            except:
-                                pass
+                            if os.path.exists(txt_filename):
+                                try:
+                                    os.remove(txt_filename)
+                                except:
+                                    pass
                                 
-                        return True
-                    except Exception as e:
-                        log(f"❌ Error moving file: {e}")
-                        return False
+                            return True
+                        except Exception as e:
+                            log(f"❌ Error moving file: {e}")
+                            return False
                 
-                if not success:
-                    log("\n📋 Manual command (try running this in terminal):")
-                    log(f'yt-dlp --ignore-errors --no-warnings --fixup detect_or_warn --fragment-retries 10 --retry-sleep fragment:5 --hls-prefer-native --limit-rate {CONFIG.get("download_speed", DOWNLOAD_SPEED)} --user-agent "{USER_AGENT}" -o "{final_filename}" "{master_url}"')
-                return success
+                    if not success:
+                        log("\n📋 Manual command (try running this in terminal):")
+                        log(manual_ytdlp_command(final_filename, master_url, finder.last_rate))
+                    return success
+                finally:
+                    DISK_SPACE.release(*reserved)
             else:
                 log(f"\n📋 Manual command:")
-                log(f'yt-dlp --ignore-errors --no-warnings --fixup detect_or_warn --fragment-retries 10 --retry-sleep fragment:5 --hls-prefer-native --limit-rate {CONFIG.get("download_speed", DOWNLOAD_SPEED)} --user-agent "{USER_AGENT}" -o "{final_filename}" "{master_url}"')
+                log(manual_ytdlp_command(final_filename, master_url))
                 return True
         else:
             log("\n❌ yt-dlp not found")
             log(f"\n📋 Save this command:")
-            log(f'yt-dlp --ignore-errors --no-warnings --fixup detect_or_warn --fragment-retries 10 --retry-sleep fragment:5 --hls-prefer-native --limit-rate {CONFIG.get("download_speed", DOWNLOAD_SPEED)} --user-agent "{USER_AGENT}" -o "{final_filename}" "{master_url}"')
+            log(manual_ytdlp_command(final_filename, master_url))
             return True
         
     else:
-        if headless:
-            log("\n⚠️  Headless capture failed. Retrying in visible mode to bypass Cloudflare...")
-            return await process_video(url, headless=False, auto_mode=auto_mode)
-            
         log("❌ FAILED - No master.m3u8 found")
         return False
 
+async def cooldown_sleep(wait):
+    """Sleep between queue items, waking early if the user pressed Stop."""
+    end = time.monotonic() + wait
+    while not stop_requested():
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(0.5, remaining))
+
+class HostScheduler:
+    """
+    Per-host cooldowns for queue mode:
+    - Remembers when each embed domain and each stream CDN was last hit.
+    - An item only waits if its own host is still cooling down, so mixed queues
+      and items whose host was last used minutes ago start immediately.
+    """
+    def __init__(self):
+        self.last_used = {}
+        self.cooldowns = {}
+
+    @staticmethod
+    def host_of(url):
+        return urllib.parse.urlparse(url).netloc.lower()
+
+    def touch(self, url, cooldown_range=None):
+        """Marks the host as just used and picks how long it should rest."""
+        host = self.host_of(url)
+        low, high = cooldown_range or (CONFIG.get('min_cooldown', COOLDOWN_RANGE[0]), CONFIG.get('max_cooldown', COOLDOWN_RANGE[1]))
+        self.last_used[host] = time.monotonic()
+        self.cooldowns[host] = random.randint(int(low), int(high))
+
+    async def wait_turn(self, url, cooldown_range=None):
+        """Waits until the host has cooled down, then claims it for this item."""
+        host = self.host_of(url)
+        announced = False
+        while not stop_requested():
+            last = self.last_used.get(host)
+            remaining = 0 if last is None else last + self.cooldowns[host] - time.monotonic()
+            if remaining <= 0:
+                break
+            if not announced:
+                log(f"⏳ {host} is cooling down ({remaining:.0f}s)...")
+                report_status(f"Cooling down {remaining:.0f}s...")
+                announced = True
+            # Re-check afterwards: another worker may have claimed the host meanwhile.
+            await cooldown_sleep(remaining)
+        # Claim immediately (no await in between) so parallel workers queue up behind us.
+        self.touch(url, cooldown_range)
+
+HOST_SCHEDULER = HostScheduler()
+
+def cdn_cooldown_range():
+    wait = CONFIG.get('cdn_cooldown', 5)
+    return (wait, wait)
+
+def to_embed_url(url):
+    """Normalizes a queue entry to the URL the browser will actually open (IMDB links become vsembed)."""
+    if not url.startswith('http'):
+        url = 'https://' + url
+    if "imdb.com/title/" in url:
+        match = re.search(r'(tt\d+)', url)
+        if match:
+            url = f"https://vsembed.ru/embed/movie?imdb={match.group(1)}"
+    return url
+
+async def schedule_download(capture):
+    """Runs download_video() once the stream's CDN has cooled down, then marks it used."""
+    if capture.master_url:
+        with span('cdn_wait'):
+            await HOST_SCHEDULER.wait_turn(capture.master_url, cdn_cooldown_range())
+        check_stop()
+    try:
+        return await download_video(capture, auto_mode=True)
+    finally:
+        if capture.master_url:
+            HOST_SCHEDULER.touch(capture.master_url, cdn_cooldown_range())
+
+async def run_queue_pipeline(items, on_result, workers=None, headless=True, on_start=None, pipeline=None, buffer=None, download_workers=None, capture_stage=None, download_stage=None):
+    """
+    Runs queue items through the capture and download stages.
+    - 'items' is a list of (index, url) pairs that survived the resume checks.
+    - With one worker, items run strictly in order: capture, then download.
+    - Cooldowns are per host (see HostScheduler): a capture waits only while its
+      embed domain is cooling, a download only while its CDN is.
+    - With N workers, N captures hunt in parallel (one pooled browser each) and
+      feed their master URLs into the download stage.
+    - With M download workers, up to M downloads overlap; together they stay
+      within the global bandwidth budget (see BandwidthManager).
+    - In pipelined mode the next item is hunted while the current one downloads;
+      at most 'buffer' captured items wait for the download stage.
+    - on_start(index, url) runs when an item's capture begins.
+    - on_result(index, url, result) runs after each download; returning False stops the queue.
+      'result' is process_video()'s return value, or the exception the item raised.
+    - capture_stage(url, headless, auto_mode) and download_stage(capture) replace
+      capture_video() / schedule_download() when given.
+    Unset options fall back to capture_workers / capture_pipeline / capture_buffer /
+    download_workers in CONFIG.
+    """
+    workers = max(1, int(workers if workers is not None else CONFIG.get('capture_workers', 1)))
+    pipeline = pipeline if pipeline is not None else CONFIG.get('capture_pipeline', False)
+    buffer = max(1, int(buffer if buffer is not None else CONFIG.get('capture_buffer', 1)))
+    download_workers = max(1, int(download_workers if download_workers is not None else CONFIG.get('download_workers', 1)))
+    capture_stage = capture_stage or capture_video
+    download_stage = download_stage or schedule_download
+
+    report = RunReport()
+    token = RUN_REPORT.set(report)
+    try:
+        await _run_queue_stages(items, on_result, workers, headless, on_start, pipeline, buffer, download_workers, capture_stage, download_stage)
+    finally:
+        RUN_REPORT.reset(token)
+        report.write()
+
+async def _run_queue_stages(items, on_result, workers, headless, on_start, pipeline, buffer, download_workers, capture_stage, download_stage):
+    if workers == 1 and not pipeline and download_workers == 1:
+        for index, url in items:
+            await HOST_SCHEDULER.wait_turn(to_embed_url(url))
+            if stop_requested():
+                return
+            if on_start:
+                on_start(index, url)
+            begin_job(url)
+            try:
+                try:
+                    capture = await capture_stage(url, headless=headless, auto_mode=True)
+                finally:
+                    end_phase()
+                    HOST_SCHEDULER.touch(to_embed_url(url))
+                try:
+                    result = await download_stage(capture)
+                finally:
+                    release_capture(capture)
+            except Exception as e:
+                finish_job(e)
+                if "Stopped by user" in str(e):
+                    raise
+                result = e
+            else:
+                finish_job(result)
+            if on_result(index, url, result) is False:
+                return
+        return
+
+    if workers > 1:
+        log(f"🧵 Capturing with {workers} parallel workers...")
+    elif pipeline:
+        log(f"🧵 Pipelined mode: hunting the next item while downloading (buffer: {buffer})...")
+    if download_workers > 1:
+        log(f"🧵 Running up to {download_workers} downloads at once (sharing one bandwidth budget)...")
+    get_browser_pool().ensure_size(workers)
+
+    pending = asyncio.Queue()
+    for item in items:
+        pending.put_nowait(item)
+    captured = asyncio.Queue()
+    # Bounds captures that are running or waiting for the download stage, so we
+    # never hunt far ahead of the downloader (captured master URLs expire).
+    ahead = asyncio.Semaphore(max(workers, buffer))
+
+    async def capture_worker():
+        while not stop_requested():
+            await ahead.acquire()
+            try:
+                index, url = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                ahead.release()
+                return
+            await HOST_SCHEDULER.wait_turn(to_embed_url(url))
+            if stop_requested():
+                ahead.release()
+                return
+            if on_start:
+                on_start(index, url)
+            job = begin_job(url)
+            try:
+                outcome = await capture_stage(url, headless=headless, auto_mode=True)
+            except Exception as e:
+                outcome = e
+            end_phase()
+            HOST_SCHEDULER.touch(to_embed_url(url))
+            await captured.put((index, url, outcome, job))
+
+    async def close_stage():
+        await asyncio.gather(*capture_tasks, return_exceptions=True)
+        await captured.put(None)
+
+    capture_tasks = [asyncio.create_task(capture_worker()) for _ in range(workers)]
+    closer = asyncio.create_task(close_stage())
+
+    stopped = False
+
+    async def download_worker():
+        nonlocal stopped
+        while not stopped:
+            entry = await captured.get()
+            if entry is None:
+                # Pass the end marker on to the other download workers
+                await captured.put(None)
+                return
+            ahead.release()
+            index, url, outcome, job = entry
+            resume_job(job)
+            if isinstance(outcome, Exception):
+                finish_job(outcome)
+                if "Stopped by user" in str(outcome):
+                    raise outcome
+                result = outcome
+            else:
+                try:
+                    try:
+                        result = await download_stage(outcome)
+                    finally:
+                        release_capture(outcome)
+                except Exception as e:
+                    finish_job(e)
+                    if "Stopped by user" in str(e):
+                        raise
+                    result = e
+                else:
+                    finish_job(result)
+            if stopped:
+                return
+            if on_result(index, url, result) is False:
+                stopped = True
+
+    download_tasks = [asyncio.create_task(download_worker()) for _ in range(download_workers)]
+    try:
+        running = set(download_tasks)
+        while running and not stopped:
+            done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    finally:
+        for task in capture_tasks + download_tasks + [closer]:
+            task.cancel()
+        await asyncio.gather(*capture_tasks, *download_tasks, closer, return_exceptions=True)
+        # Captures that never reached a download worker (queue stopped)
+        while not captured.empty():
+            entry = captured.get_nowait()
+            if entry is not None:
+                release_capture(entry[2])
+
+class QueueItem:
+    """One queue entry and what became of it."""
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.status = "pending"  # pending, skipped, running, done, 404, failed, error
+        self.reason = ""
+        self.result = None
+
+class QueueEngine:
+    """
+    The queue runner shared by the CLI queue mode and the GUI batches.
+    - Resume checks run in order; the first one that returns a reason skips the item.
+      Defaults: the completion store, then the library under 'library_dir', which
+      self-heals the store for files that are already on disk. Extra checks
+      (check(item) -> reason or None) can be added with 'checks'.
+    - The remaining items go through run_queue_pipeline(), so workers, pipelining and
+      cooldowns behave the same on both front ends. 'capture_stage' / 'download_stage'
+      replace the default stages.
+    - Finished items are marked in the completion store; 404s are collected in
+      'not_found'. A 404 on S01E01 aborts the queue (the series is most likely gone).
+    - With 'stop_on_failure', the first failed download stops the queue so it can be
+      resumed. Items that raised are logged and skipped either way.
+    - on_skip(item), on_start(item) and on_result(item) report progress;
+      on_result returning False stops the queue.
+    """
+    def __init__(self, urls, library_dir=None, checks=None, stop_on_failure=False,
+                 on_skip=None, on_start=None, on_result=None, capture_stage=None, download_stage=None):
+        self.items = [QueueItem(i, url) for i, url in enumerate(urls)]
+        self.library_dir = library_dir
+        self.checks = [self.check_completed, self.check_library] + list(checks or [])
+        self.stop_on_failure = stop_on_failure
+        self.on_skip = on_skip
+        self.on_start = on_start
+        self.on_result = on_result
+        self.capture_stage = capture_stage
+        self.download_stage = download_stage
+        self.store = get_completed_store()
+        self.not_found = []
+        self.aborted = False
+
+    def check_completed(self, item):
+        if self.store.is_completed(item.url):
+            _, s_num, e_num = self.store.parse_key(item.url)
+            return f"already completed (S{s_num:02d}E{e_num:02d})" if s_num is not None else "already completed"
+        return None
+
+    def check_library(self, item):
+        if not self.library_dir:
+            return None
+        f_name = get_library_index().find_episode_for_url(self.library_dir, item.url)
+        if f_name:
+            self.store.mark(item.url)
+            return f"file exists ({f_name})"
+        return None
+
+    def plan(self):
+        """Runs the resume checks and returns the items that still need work."""
+        pending = []
+        for item in self.items:
+            for check in self.checks:
+                reason = check(item)
+                if reason:
+                    item.status = "skipped"
+                    item.reason = reason
+                    break
+            if item.status != "skipped":
+                pending.append(item)
+                continue
+            log(f"⏭️  Skipping ({item.reason}): {item.url}")
+            note_skipped(item.url, item.reason)
+            if self.on_skip:
+                self.on_skip(item)
+        return pending
+
+    def is_pilot(self, url):
+        _, s_num, e_num = self.store.parse_key(url)
+        return (s_num, e_num) == (1, 1)
+
+    def finish(self, item, result):
+        item.result = result
+        if isinstance(result, Exception):
+            item.status = "error"
+            item.reason = str(result)
+            log(f"❌ Error in queue loop: {result}")
+        elif result is True:
+            item.status = "done"
+            self.store.mark(item.url)
+            log("✅ Marked as complete.")
+        elif result == "404":
+            item.status = "404"
+            self.not_found.append(item.url)
+            log("⏭️  Skipping 404 item...", level="warning")
+            if self.is_pilot(item.url):
+                log("🛑 Critical Failure: Season 1 Episode 1 is 404. Aborting series download.", level="error")
+                self.aborted = True
+        else:
+            item.status = "failed"
+            log(f"❌ Failed downloading: {item.url}")
+        if item.status == "failed" and self.stop_on_failure:
+            self.aborted = True
+        if self.on_result and self.on_result(item) is False:
+            self.aborted = True
+        return False if self.aborted else None
+
+    async def run(self, headless=True):
+        """Plans and processes the queue; returns the list of items."""
+        pending = self.plan()
+        by_index = {item.index: item for item in pending}
+
+        def on_start(index, url):
+            item = by_index[index]
+            item.status = "running"
+            if self.on_start:
+                self.on_start(item)
+
+        def on_result(index, url, result):
+            return self.finish(by_index[index], result)
+
+        await run_queue_pipeline([(item.index, item.url) for item in pending], on_result,
+                                 headless=headless, on_start=on_start,
+                                 capture_stage=self.capture_stage, download_stage=self.download_stage)
+        return self.items
+
+    def report_not_found(self):
+        if not self.not_found:
+            return
+        log(f"\n{'='*20} Summary of 404 Not Found Items {'='*20}")
+        for url in self.not_found:
+            log(f"❌ {url}")
+        log("="*60)
+
 async def get_imdb_info(imdb_id):
     url = f"https://www.imdb.com/title/{imdb_id}/"
     log(f"🕵️  Scanning IMDB: {url}")
@@ -1140,15 +3596,25 @@ async def get_season_episodes(imdb_id, season):
             await browser.close()
             return 0
 
-def clear_session(reason=""):
-    if os.path.exists("browser_session"):
+def clear_session(reason="", session_dir=None):
+    """Wipe one browser profile, or every pool slot profile when no directory is given."""
+    if session_dir:
+        session_dirs = [session_dir]
+    else:
+        base_dir = get_base_dir()
+        session_dirs = [os.path.join(base_dir, d) for d in os.listdir(base_dir)
+                        if re.fullmatch(r'browser_session(_\d+)?', d)]
+
+    for path in session_dirs:
+        if not os.path.exists(path):
+            continue
         message = f"\n🧹 Clearing browser session"
         if reason:
             message += f" ({reason})"
         message += "..."
         log(message)
         try:
-            shutil.rmtree("browser_session")
+            shutil.rmtree(path)
             log("   ✅ Session cleared.")
         except Exception as e:
             log(f"   ⚠️ Failed to clear session: {e}")
@@ -1163,8 +3629,37 @@ def load_config():
         "download_speed": DOWNLOAD_SPEED,
         "min_cooldown": COOLDOWN_RANGE[0],
         "max_cooldown": COOLDOWN_RANGE[1],
+        "cdn_cooldown": 5,
         "subtitle_langs": "all",
-        "session_reset_count": 5
+        "session_reset_count": 5,
+        "capture_workers": 1,
+        "capture_pipeline": False,
+        "capture_buffer": 1,
+        "download_workers": 1,
+        "total_download_speed": "",
+        "log_max_lines": 5000,
+        "log_json": "",
+        "run_report": "run_report.json",
+        "metrics_file": "",
+        "metrics_port": 0,
+        "metrics_interval": 15,
+        "serve_port": 8787,
+        "serve_workers": 1,
+        "staging_mode": "target",
+        "check_disk_space": True,
+        "disk_space_margin_mb": 500,
+        "preallocate_downloads": False,
+        "download_engine": "ytdlp",
+        "segment_concurrency": 6,
+        "segment_retries": 5,
+        "adaptive_rate": True,
+        "max_download_speed": "25M",
+        "min_download_speed": "1M",
+        "rate_probe_after": 600,
+        "capture_cache_ttl": 1800,
+        "variant_max_height": 0,
+        "variant_max_kbps": 0,
+        "variant_min_kbps": 0
     }
     
     if os.path.exists(config_file):
@@ -1195,7 +3690,9 @@ async def search_imdb(query, filter_type='all'):
     }
 
     try:
-        response = requests.get(url, headers=headers)
+        # Off the loop (the GUI shares it with running batches), and never wait forever on IMDB
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: requests.get(url, headers=headers, timeout=15))
         response.raise_for_status()
         
         soup = BeautifulSoup(response.content, "html.parser")
@@ -1342,6 +3839,332 @@ async def scrape_imdb_chart(chart_type, limit=250):
         finally:
             await browser.close()
 
+def pop_cli_option(args, name):
+    """Remove '--name value' or '--name=value' from args and return the value (None if absent)."""
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        if arg.startswith(name + '='):
+            del args[i]
+            return arg.split('=', 1)[1]
+    return None
+
+# --- SERVICE MODE ---
+# Job currently being processed by this task (lets log/stop callbacks find it)
+SERVE_JOB = contextvars.ContextVar('serve_job', default=None)
+
+class ServeJob:
+    """One URL submitted to the service, with its status and the tail of its log."""
+    LOG_LINES = 500
+
+    def __init__(self, url):
+        self.id = uuid.uuid4().hex[:8]
+        self.url = url
+        self.status = "queued"
+        self.result = None
+        self.progress = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=self.LOG_LINES)
+        # Total lines ever logged, so event streams can tell where they left off
+        self.line_count = 0
+
+    def add_line(self, line):
+        with self.lock:
+            self.lines.append(line)
+            self.line_count += 1
+
+    def lines_since(self, seen):
+        """Lines logged after the first 'seen' ones (as far as the tail still has them), and the new total."""
+        with self.lock:
+            new = min(self.line_count - seen, len(self.lines))
+            return list(self.lines)[len(self.lines) - new:], self.line_count
+
+    def to_dict(self, with_log=False):
+        data = {
+            'id': self.id, 'url': self.url, 'status': self.status, 'result': self.result,
+            'progress': self.progress, 'created': self.created, 'started': self.started, 'finished': self.finished,
+        }
+        if with_log:
+            with self.lock:
+                data['log'] = list(self.lines)
+        return data
+
+class JobService:
+    """
+    Long-running queue behind 'capture_m3u8.py serve':
+    - Jobs run through process_video() on one event loop, so the browser pool,
+      caches and the completion store stay warm between requests.
+    - serve_workers jobs run at once (default 1); embed hosts keep their cooldowns.
+    - Cancelling a running job makes check_stop() fire inside that job only.
+    """
+    def __init__(self, loop, workers=1):
+        self.loop = loop
+        self.workers = max(1, int(workers))
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.order = []
+        self.pending = asyncio.Queue()
+
+    # Called from the HTTP threads
+    def submit(self, urls):
+        store = get_completed_store()
+        created = []
+        for url in urls:
+            job = ServeJob(url)
+            with self.lock:
+                self.jobs[job.id] = job
+                self.order.append(job.id)
+            if store.is_completed(url):
+                job.status, job.finished = "skipped", time.time()
+                note_skipped(url, "completed")
+            else:
+                self.loop.call_soon_threadsafe(self.pending.put_nowait, job)
+            created.append(job)
+        return created
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [self.jobs[job_id] for job_id in self.order]
+
+    def cancel(self, job):
+        job.cancelled = True
+        if job.status == "queued":
+            job.status, job.finished = "cancelled", time.time()
+
+    # Callbacks installed with setup_interface()
+    def on_log(self, text, level=None):
+        print(text, end="")
+        job = SERVE_JOB.get()
+        if job is not None:
+            for line in text.splitlines():
+                if line.strip():
+                    job.add_line(line)
+
+    def on_status(self, message):
+        job = SERVE_JOB.get()
+        if job is not None:
+            job.progress = message
+
+    def should_stop(self):
+        job = SERVE_JOB.get()
+        return bool(job and job.cancelled)
+
+    async def worker(self):
+        store = get_completed_store()
+        while True:
+            job = await self.pending.get()
+            if job.cancelled:
+                continue
+            SERVE_JOB.set(job)
+            job.status, job.started = "running", time.time()
+            embed_url = to_embed_url(job.url)
+            try:
+                await HOST_SCHEDULER.wait_turn(embed_url)
+                check_stop()
+                try:
+                    result = await process_video(job.url, headless=True, auto_mode=True)
+                finally:
+                    HOST_SCHEDULER.touch(embed_url)
+            except Exception as e:
+                result = e
+            SERVE_JOB.set(None)
+            if job.cancelled:
+                job.status = "cancelled"
+            elif isinstance(result, Exception):
+                job.status, job.result = "failed", str(result)
+            elif result is True:
+                job.status = "done"
+                store.mark(job.url)
+            elif result == "404":
+                job.status = "404"
+            else:
+                job.status = "failed"
+            # Last: the event stream ends as soon as it sees 'finished', so the status must be final
+            job.finished = time.time()
+
+    async def run(self):
+        await asyncio.gather(*(self.worker() for _ in range(self.workers)))
+
+def parse_job_request(body):
+    """
+    URLs from a POST /jobs body:
+    {"url": "..."}, {"urls": [...]}, {"imdb": "tt1234567"} or
+    {"imdb": "tt1234567", "season": 1, "episode": 2} (episodes: a number or a list).
+    """
+    urls = []
+    if body.get('url'):
+        urls.append(str(body['url']).strip())
+    urls.extend(str(u).strip() for u in body.get('urls', []) if str(u).strip())
+    imdb_id = body.get('imdb')
+    if imdb_id:
+        match = re.search(r'(tt\d{7,})', str(imdb_id))
+        if not match:
+            raise ValueError(f"Not an IMDB ID: {imdb_id}")
+        imdb_id = match.group(1)
+        if body.get('season'):
+            episodes = body.get('episode', 1)
+            for e in (episodes if isinstance(episodes, list) else [episodes]):
+                urls.append(f"https://vidsrcme.ru/embed/tv?imdb={imdb_id}&season={int(body['season'])}&episode={int(e)}")
+        else:
+            urls.append(f"https://www.imdb.com/title/{imdb_id}/")
+    if not urls:
+        raise ValueError("Nothing to enqueue: give 'url', 'urls' or 'imdb'")
+    return urls
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """
+    Local HTTP/JSON API of the service:
+    - POST   /jobs              enqueue (see parse_job_request)
+    - GET    /jobs              list jobs
+    - GET    /jobs/<id>         one job, with its log tail
+    - DELETE /jobs/<id>         cancel (also POST /jobs/<id>/cancel)
+    - GET    /jobs/<id>/events  progress as a server-sent event stream, until the job ends
+    - GET    /metrics           Prometheus metrics
+    Only local tools may call it: requests from a web page (an Origin header), under a
+    foreign Host name (DNS rebinding) or, for POST, without a JSON body type are refused.
+    """
+    service = None
+    # 127.0.0.1:<port> and localhost:<port>, set by serve()
+    allowed_hosts = ()
+
+    def log_message(self, format, *args):
+        pass
+
+    def client_allowed(self, json_body=False):
+        """Sends 403/415 and returns False unless the request comes from a local, non-browser client."""
+        if self.headers.get('Origin') is not None or self.headers.get('Host', '').lower() not in self.allowed_hosts:
+            self.send_json(403, {'error': 'forbidden'})
+            return False
+        if json_body and self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            self.send_json(415, {'error': 'Content-Type must be application/json'})
+            return False
+        return True
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def find_job(self, parts):
+        job = self.service.get(parts[1]) if len(parts) > 1 else None
+        if job is None:
+            self.send_json(404, {'error': 'no such job'})
+        return job
+
+    def do_GET(self):
+        if not self.client_allowed():
+            return
+        parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+        if parts == ['metrics']:
+            body = METRICS.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ['jobs']:
+            self.send_json(200, {'jobs': [job.to_dict() for job in self.service.list()]})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.find_job(parts)
+            if job:
+                self.send_json(200, job.to_dict(with_log=True))
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+            job = self.find_job(parts)
+            if job:
+                self.stream_events(job)
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if not self.client_allowed(json_body=True):
+            return
+        parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+        if parts == ['jobs']:
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                urls = parse_job_request(body)
+            except (ValueError, TypeError, AttributeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            jobs = self.service.submit(urls)
+            self.send_json(201, {'jobs': [job.to_dict() for job in jobs]})
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            self.cancel_job(parts)
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_DELETE(self):
+        if not self.client_allowed():
+            return
+        self.cancel_job([p for p in self.path.split('?', 1)[0].split('/') if p])
+
+    def cancel_job(self, parts):
+        if len(parts) >= 2 and parts[0] == 'jobs':
+            job = self.find_job(parts)
+            if job:
+                self.service.cancel(job)
+                self.send_json(200, job.to_dict())
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def stream_events(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        sent, status, progress = 0, None, None
+        try:
+            while True:
+                lines, sent = job.lines_since(sent)
+                for line in lines:
+                    self.wfile.write(f"data: {json.dumps({'type': 'log', 'text': line})}\n\n".encode('utf-8'))
+                if (job.status, job.progress) != (status, progress):
+                    status, progress = job.status, job.progress
+                    self.wfile.write(f"data: {json.dumps({'type': 'status', 'status': status, 'progress': progress})}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                if job.finished:
+                    self.wfile.write(f"data: {json.dumps({'type': 'end', 'status': job.status})}\n\n".encode('utf-8'))
+                    return
+                time.sleep(0.5)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+async def serve(port):
+    """'capture_m3u8.py serve': runs the job service until interrupted."""
+    service = JobService(asyncio.get_running_loop(), workers=CONFIG.get('serve_workers', 1))
+    # Jobs download side by side, so the bandwidth budget must expect that many downloads
+    CONFIG['download_workers'] = max(int(CONFIG.get('download_workers', 1)), service.workers)
+    # Every worker needs its own browser, whatever capture_workers says
+    get_browser_pool().ensure_size(service.workers)
+    setup_interface(log_cb=service.on_log, status_cb=service.on_status, stop_cb=service.should_stop)
+    # /metrics is always served here, so feed it even without metrics_file/metrics_port
+    add_log_sink(METRICS)
+    ServiceHandler.service = service
+    ServiceHandler.allowed_hosts = (f"127.0.0.1:{port}", f"localhost:{port}")
+    server = ThreadingHTTPServer(('127.0.0.1', port), ServiceHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="service-http", daemon=True).start()
+    print(f"🛰️  Service listening on http://127.0.0.1:{port} ({service.workers} worker(s))")
+    print(f"   Enqueue: curl -X POST http://127.0.0.1:{port}/jobs -H 'Content-Type: application/json' -d '{{\"imdb\": \"tt0111161\"}}'")
+    try:
+        await service.run()
+    finally:
+        server.shutdown()
+
 async def main():
     """
     Entry point:
@@ -1365,8 +4188,35 @@ async def main():
     queue_file = None
 
     # 1. Handle Arguments
-    if len(sys.argv) > 1:
-        input_arg = sys.argv[1].strip()
+    args = sys.argv[1:]
+    workers = pop_cli_option(args, '--workers')
+    if workers:
+        try:
+            CONFIG['capture_workers'] = max(1, int(workers))
+        except ValueError:
+            print(f"⚠️  Ignoring invalid --workers value: {workers}")
+    if '--pipeline' in args:
+        args.remove('--pipeline')
+        CONFIG['capture_pipeline'] = True
+    log_json = pop_cli_option(args, '--log-json')
+    if log_json:
+        CONFIG['log_json'] = log_json
+    metrics_port = pop_cli_option(args, '--metrics-port')
+    if metrics_port:
+        try:
+            CONFIG['metrics_port'] = int(metrics_port)
+        except ValueError:
+            print(f"⚠️  Ignoring invalid --metrics-port value: {metrics_port}")
+    start_metrics()
+    downloads = pop_cli_option(args, '--downloads')
+    if downloads:
+        try:
+            CONFIG['download_workers'] = max(1, int(downloads))
+        except ValueError:
+            print(f"⚠️  Ignoring invalid --downloads value: {downloads}")
+
+    if args:
+        input_arg = args[0].strip()
         if input_arg == '-U':
             print("🔄 Checking for yt-dlp updates...")
             finder = MasterM3U8Finder()
@@ -1377,6 +4227,15 @@ async def main():
             else:
                 print("❌ yt-dlp executable not found.")
             return
+        elif input_arg == 'serve':
+            port = pop_cli_option(args, '--port') or CONFIG.get('serve_port', 8787)
+            try:
+                port = int(port)
+            except ValueError:
+                print(f"❌ Invalid --port value: {port}")
+                return
+            await serve(port)
+            return
         elif input_arg == 'scrapemovie':
             results = await scrape_imdb_chart('movie')
             # Legacy CLI support: save to file
@@ -1438,107 +4297,24 @@ async def main():
         
         print(f"📊 Found {len(urls)} items in queue.")
         
-        # Global completed.log
-        script_dir = get_base_dir()
-        completed_log = os.path.join(script_dir, "completed.log")
-        completed_urls = set()
-        completed_keys = set() # (imdb_id, season, episode)
-
-        if os.path.exists(completed_log):
-            with open(completed_log, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if not line: continue
-                    completed_urls.add(line)
-                    
-                    # Smart matching extraction
-                    imdb_m = re.search(r'imdb=(tt\d+)', line)
-                    s_m = re.search(r'[?&]season=(\d+)', line)
-                    e_m = re.search(r'[?&]episode=(\d+)', line)
-                    if imdb_m and s_m and e_m:
-                        completed_keys.add((imdb_m.group(1), int(s_m.group(1)), int(e_m.group(1))))
-        
-        if os.path.exists(completed_log):
-            print(f"\n📂 Found resume log with {len(completed_urls)} entries. Will skip completed items.")
+        # Global completion store
+        completed_count = get_completed_store().count()
+        if completed_count:
+            print(f"\n📂 Found resume data with {completed_count} entries. Will skip completed items.")
 
-        session_count = 0
-        not_found_report = []
+        def on_start(item):
+            print(f"\n{'='*20} Processing {item.index+1}/{len(urls)} {'='*20}")
 
-        for i, queue_url in enumerate(urls):
-            print(f"\n{'='*20} Processing {i+1}/{len(urls)} {'='*20}")
-            
-            is_completed = False
-            if queue_url in completed_urls:
-                is_completed = True
-            else:
-                imdb_m = re.search(r'imdb=(tt\d+)', queue_url)
-                s_m = re.search(r'[?&]season=(\d+)', queue_url)
-                e_m = re.search(r'[?&]episode=(\d+)', queue_url)
-                if imdb_m and s_m and e_m:
-                    if (imdb_m.group(1), int(s_m.group(1)), int(e_m.group(1))) in completed_keys:
-                        is_completed = True
-            
-            # File existence check (self-healing)
-            if not is_completed:
-                s_m = re.search(r'[?&]season=(\d+)', queue_url)
-                e_m = re.search(r'[?&]episode=(\d+)', queue_url)
-                if s_m and e_m:
-                    s_num = int(s_m.group(1))
-                    e_num = int(e_m.group(1))
-                    
-                    season_dir = os.path.join(base_dir, f"Season {s_num:02d}")
-                    if os.path.exists(season_dir):
-                        for f_name in os.listdir(season_dir):
-                            if f_name.endswith(".mkv") and f"S{s_num:02d}E{e_num:02d}" in f_name:
-                                print(f"⏭️  Skipping (file exists): {f_name}")
-                                is_completed = True
-                                try:
-                                    with open(completed_log, 'a', encoding='utf-8') as f_log:
-                                        f_log.write(f"{queue_url}\n")
-                                    completed_urls.add(queue_url)
-                                except Exception as log_e:
-                                    print(f"   ⚠️ Could not self-heal completed.log: {log_e}")
-                                break
-
-            if is_completed:
-                print(f"⏭️  Skipping (already completed): {queue_url}")
-                continue
-            
-            try:
-                result = await process_video(queue_url, headless=True, auto_mode=True)
-                
-                if result is True:
-                    with open(completed_log, 'a', encoding='utf-8') as f:
-                        f.write(f"{queue_url}\n")
-                    print(f"✅ Marked as complete.")
-                elif result == "404":
-                    print(f"⏭️  Skipping 404 item...")
-                    
-                    # Critical Failure Check: If S01E01 is missing, likely the whole series is gone.
-                    if "season=1" in queue_url and "episode=1" in queue_url:
-                        print("🛑 Critical Failure: Season 1 Episode 1 is 404. Aborting series download.")
-                        return
+        def on_result(item):
+            if item.status == "failed":
+                print("🛑 Script terminating as requested to preserve queue state.")
+                print(f"ℹ️  To resume, run: python capture_m3u8.py \"{queue_file}\"")
 
-                    not_found_report.append(queue_url)
-                    # Do not terminate, continue to next item
-                else:
-                    print(f"\n❌ Failed downloading: {queue_url}")
-                    print("🛑 Script terminating as requested to preserve queue state.")
-                    print(f"ℹ️  To resume, run: python capture_m3u8.py \"{queue_file}\"")
-                    return
-                
-                # Session Reset Logic
-                session_count += 1
-                if CONFIG['session_reset_count'] > 0 and session_count % CONFIG['session_reset_count'] == 0:
-                    clear_session(reason=f"periodic reset after {session_count} items")
-                    
-            except Exception as e:
-                print(f"❌ Error in queue loop: {e}")
-            
-            if i < len(urls) - 1:
-                wait_time = random.randint(COOLDOWN_RANGE[0], COOLDOWN_RANGE[1])
-                print(f"⏳ Cooling down ({wait_time}s)...")
-                await asyncio.sleep(wait_time)
+        engine = QueueEngine(urls, library_dir=base_dir, stop_on_failure=True,
+                             on_start=on_start, on_result=on_result)
+        await engine.run()
+        if engine.aborted:
+            return
         
         # Auto-delete queue file if it was a generated list and completed successfully
         try:
@@ -1554,11 +4330,7 @@ async def main():
         except:
             pass
         
-        if not_found_report:
-            print(f"\n{'='*20} Summary of 404 Not Found Items {'='*20}")
-            for item in not_found_report:
-                print(f"❌ {item}")
-            print("="*60)
+        engine.report_not_found()
 
     else:
         if url and "imdb.com/title/" in url:
@@ -1628,53 +4400,17 @@ async def main():
                         
                     os.makedirs(series_dir, exist_ok=True)
                     
-                    # Global completed.log
-                    script_dir = get_base_dir()
-                    completed_log = os.path.join(script_dir, "completed.log")
+                    # Global completion store
+                    store = get_completed_store()
+                    existing_count = store.count()
+                    resume_found = existing_count > 0
                     skipped_count = 0
-                    resume_found = False
-                    existing_count = 0
                     
-                    if os.path.exists(completed_log):
-                        try:
-                            resume_found = True
-                            existing_urls = set()
-                            existing_keys = set()
-                            with open(completed_log, 'r', encoding='utf-8') as f:
-                                for line in f:
-                                    line = line.strip()
-                                    if not line: continue
-                                    existing_urls.add(line)
-                                    imdb_m = re.search(r'imdb=(tt\d+)', line)
-                                    s_m = re.search(r'[?&]season=(\d+)', line)
-                                    e_m = re.search(r'[?&]episode=(\d+)', line)
-                                    if imdb_m and s_m and e_m:
-                                        existing_keys.add((imdb_m.group(1), int(s_m.group(1)), int(e_m.group(1))))
-                            existing_count = len(existing_urls)
-                            
-                            for link in queue_list:
-                                is_skipped = False
-                                if link in existing_urls:
-                                    is_skipped = True
-                                
-                                imdb_m = re.search(r'imdb=(tt\d+)', link)
-                                s_m = re.search(r'[?&]season=(\d+)', link)
-                                e_m = re.search(r'[?&]episode=(\d+)', link)
-                                if not is_skipped and imdb_m and s_m and e_m:
-                                    s_num, e_num = int(s_m.group(1)), int(e_m.group(1))
-                                    if (imdb_m.group(1), s_num, e_num) in existing_keys:
-                                        is_skipped = True
-                                    else:
-                                        season_dir_check = os.path.join(series_dir, f"Season {s_num:02d}")
-                                        if os.path.exists(season_dir_check):
-                                            for f_name in os.listdir(season_dir_check):
-                                                if f_name.endswith(".mkv") and f"S{s_num:02d}E{e_num:02d}" in f_name:
-                                                    is_skipped = True
-                                                    break
-                                if is_skipped:
-                                    skipped_count += 1
-                        except Exception as e:
-                            print(f"   ⚠️ Could not read resume data: {e}")
+                    library = get_library_index()
+                    for link in queue_list:
+                        is_skipped = store.is_completed(link) or bool(library.find_episode_for_url(series_dir, link))
+                        if is_skipped:
+                            skipped_count += 1
 
                     queue_filename = os.path.join(series_dir, f"{safe_title}.txt")
                     
@@ -1686,9 +4422,9 @@ async def main():
                     print(f"   Contains {len(queue_list)} items.")
                     
                     if resume_found:
-                        print(f"   📂 Found resume log with {existing_count} entries.")
+                        print(f"   📂 Found resume data with {existing_count} entries.")
                         if skipped_count > 0:
-                            print(f"   ℹ️  {skipped_count} items are already in completed.log and will be skipped.")
+                            print(f"   ℹ️  {skipped_count} items are already completed and will be skipped.")
                     
                     run_now = input("🚀 Start processing this queue now? (y/n) [default: y]: ").strip().lower() or 'y'
                     if run_now == 'y':
@@ -1705,7 +4441,7 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(with_browser_pool(main()))
     except KeyboardInterrupt:
         print("\n\n⚠️  Interrupted by user")
     finally:
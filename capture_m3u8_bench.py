@@ -0,0 +1,376 @@
+import os
+import sys
+import asyncio
+import json
+import re
+import time
+import shutil
+import platform
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import capture_m3u8
+
+# Offline benchmark for capture_m3u8.py.
+# Serves a stand-in embed site and HLS origin on 127.0.0.1, then measures:
+# - capture: time from opening the embed page to a verified master URL (MasterM3U8Finder.capture)
+# - native:  segment download throughput of the built-in HLS engine
+# - ytdlp:   download throughput of run_ytdlp (skipped if yt-dlp isn't installed)
+# Results go to a JSON file so runs from different commits can be compared.
+#
+# Usage:
+#   python capture_m3u8_bench.py [--runs 5] [--segments 40] [--segment-kb 256] [--latency-ms 20]
+#                                [--js-delay-ms 1500] [--throttle-every 0] [--only capture,native,ytdlp]
+#                                [--out bench_results.json] [--verbose]
+
+SEGMENT_SECONDS = 4
+# MPEG-TS null packet: keeps segments valid-looking without needing real media
+NULL_PACKET = b'\x47\x1f\xff\x10' + b'\xff' * 184
+
+EMBED_PAGE = """<!DOCTYPE html>
+<html><head><title>Bench Movie {id}</title></head>
+<body>
+<h1>Bench Movie {id}</h1>
+<iframe src="/rcp/{id}" width="800" height="450" allowfullscreen></iframe>
+<script src="/ads/ad.js"></script>
+</body></html>"""
+
+RCP_PAGE = """<!DOCTYPE html>
+<html><head><title>Player</title></head>
+<body><iframe src="/prorcp/{id}" width="800" height="450" allowfullscreen></iframe></body></html>"""
+
+# The stream is only requested after a delay, from script, like the real players do
+PRORCP_PAGE = """<!DOCTYPE html>
+<html><head><title>Player</title></head>
+<body>
+<video id="player" muted width="800" height="450"></video>
+<button class="play-button">Play</button>
+<script>
+setTimeout(function () {{
+    fetch('/hls/{id}/master.m3u8').then(function (r) {{ return r.text(); }}).catch(function () {{}});
+}}, {delay});
+</script>
+</body></html>"""
+
+NOT_FOUND_PAGE = """<!DOCTYPE html>
+<html><head><title>404 Not Found</title></head><body><h1>404 Not Found</h1></body></html>"""
+
+AD_SCRIPT = """(function () {
+    var n = 0;
+    var timer = setInterval(function () {
+        new Image().src = '/ads/pixel.gif?n=' + (n++);
+        if (n > 20) clearInterval(timer);
+    }, 200);
+    var frame = document.createElement('iframe');
+    frame.src = '/ads/banner.html';
+    frame.width = 300;
+    frame.height = 250;
+    document.body.appendChild(frame);
+})();"""
+
+AD_BANNER = """<!DOCTYPE html><html><body><a href="#">Advertisement</a><script src="/ads/ad.js"></script></body></html>"""
+
+class BenchOrigin(ThreadingHTTPServer):
+    """
+    Local embed site + HLS origin:
+    - /embed/movie/<id> -> /rcp/<id> -> /prorcp/<id>, which fetches the master playlist after js_delay_ms.
+    - /embed/movie/404 is a "not found" page.
+    - /hls/<id>/master.m3u8 lists a 720p and a 360p variant of 'segments' segments each.
+    - Every HLS response waits latency_ms; with throttle_every N, the first request
+      for every Nth segment gets a 429.
+    """
+    daemon_threads = True
+
+    def __init__(self, segments=40, segment_kb=256, latency_ms=20, js_delay_ms=1500, throttle_every=0):
+        super().__init__(('127.0.0.1', 0), BenchHandler)
+        self.segments = segments
+        self.segment_bytes = max(1, segment_kb * 1024 // len(NULL_PACKET)) * len(NULL_PACKET)
+        self.latency = latency_ms / 1000
+        self.js_delay_ms = js_delay_ms
+        self.throttle_every = throttle_every
+        self.lock = threading.Lock()
+        self.seen = set()
+        self.counters = {'requests': 0, 'segments': 0, 'throttled': 0}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def should_throttle(self, path, index):
+        """429 on the first request for every Nth segment; the retry goes through."""
+        if not self.throttle_every or (index + 1) % self.throttle_every:
+            return False
+        with self.lock:
+            if path in self.seen:
+                return False
+            self.seen.add(path)
+            return True
+
+    def master_playlist(self, item):
+        bandwidth = self.segment_bytes * 8 // SEGMENT_SECONDS
+        return "\n".join([
+            "#EXTM3U",
+            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION=1280x720",
+            f"/hls/{item}/720p/index.m3u8",
+            f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth // 2},RESOLUTION=640x360",
+            f"/hls/{item}/360p/index.m3u8",
+            "",
+        ])
+
+    def media_playlist(self, item, variant):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(self.segments):
+            lines.append(f"#EXTINF:{SEGMENT_SECONDS:.1f},")
+            lines.append(f"/hls/{item}/{variant}/seg{i}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, variant):
+        size = self.segment_bytes if variant == '720p' else self.segment_bytes // 2
+        return NULL_PACKET * (size // len(NULL_PACKET))
+
+class BenchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        origin = self.server
+        origin.count('requests')
+        path = self.path.split('?', 1)[0]
+
+        match = re.match(r'^/embed/movie/(\w+)$', path)
+        if match:
+            if match.group(1) == '404':
+                return self.send(404, NOT_FOUND_PAGE)
+            return self.send(200, EMBED_PAGE.format(id=match.group(1)))
+        match = re.match(r'^/(rcp|prorcp)/(\w+)$', path)
+        if match:
+            page = RCP_PAGE if match.group(1) == 'rcp' else PRORCP_PAGE
+            return self.send(200, page.format(id=match.group(2), delay=origin.js_delay_ms))
+        if path == '/ads/ad.js':
+            return self.send(200, AD_SCRIPT, "application/javascript")
+        if path == '/ads/banner.html':
+            return self.send(200, AD_BANNER)
+        if path == '/ads/pixel.gif':
+            return self.send(200, b'GIF89a\x01\x00\x01\x00\x00\x00\x00;', "image/gif")
+
+        if path.startswith('/hls/'):
+            time.sleep(origin.latency)
+            match = re.match(r'^/hls/(\w+)/master\.m3u8$', path)
+            if match:
+                return self.send(200, origin.master_playlist(match.group(1)), "application/vnd.apple.mpegurl")
+            match = re.match(r'^/hls/(\w+)/(720p|360p)/index\.m3u8$', path)
+            if match:
+                return self.send(200, origin.media_playlist(match.group(1), match.group(2)), "application/vnd.apple.mpegurl")
+            match = re.match(r'^/hls/(\w+)/(720p|360p)/seg(\d+)\.ts$', path)
+            if match and int(match.group(3)) < origin.segments:
+                if origin.should_throttle(path, int(match.group(3))):
+                    origin.count('throttled')
+                    return self.send(429, "Too Many Requests", "text/plain", {"Retry-After": "1"})
+                origin.count('segments')
+                return self.send(200, origin.segment(match.group(2)), "video/mp2t")
+        self.send(404, NOT_FOUND_PAGE)
+
+def summarize(values):
+    """count / min / p50 / p95 / max of a list of numbers (empty dict if there are none)."""
+    if not values:
+        return {}
+    return {
+        'count': len(values),
+        'min': round(min(values), 1),
+        'p50': round(capture_m3u8.percentile(values, 50), 1),
+        'p95': round(capture_m3u8.percentile(values, 95), 1),
+        'max': round(max(values), 1),
+    }
+
+async def bench_capture(origin, runs, workdir):
+    """Time-to-master-URL over 'runs' embed pages (the first one includes the browser launch), plus the 404 page."""
+    times, spans, found = [], {}, 0
+    not_found = None
+    # A throwaway profile: the user's browser_session must not collect (or lose) anything
+    capture_m3u8.BROWSER_POOL = capture_m3u8.BrowserPool(size=1, reset_count=0, profile_dir=os.path.join(workdir, "profile"))
+    for i in range(runs + 1):
+        item = str(i + 1) if i < runs else '404'
+        url = f"{origin.base_url}/embed/movie/{item}"
+        job = capture_m3u8.begin_job(url)
+        finder = capture_m3u8.MasterM3U8Finder()
+        start = time.monotonic()
+        try:
+            master_url, title, _, status = await finder.capture(url, headless=True)
+        except Exception as e:
+            master_url, status = None, f"error: {e}"
+        finally:
+            finder.discard_cookies()
+        elapsed = (time.monotonic() - start) * 1000
+        if item == '404':
+            not_found = {'ms': round(elapsed, 1), 'status': status}
+            continue
+        print(f"   capture {item}: {elapsed:.0f} ms ({'found' if master_url else status})")
+        if master_url:
+            found += 1
+            times.append(elapsed)
+            for name, value in job['spans'].items():
+                spans.setdefault(name, []).append(value * 1000)
+    await capture_m3u8.close_browser_pool()
+    return {
+        'runs': runs,
+        'found': found,
+        'time_to_master_ms': summarize(times),
+        'first_ms': round(times[0], 1) if times else None,
+        'warm_ms': summarize(times[1:]),
+        'spans_ms': {name: summarize(values) for name, values in spans.items()},
+        'not_found': not_found,
+    }
+
+async def bench_native(origin, runs, workdir):
+    """Throughput of NativeHLSDownloader.download() (segments only, no remux)."""
+    rates, seconds = [], []
+    for i in range(runs):
+        ts_file = os.path.join(workdir, f"native_{i}.ts")
+        downloader = capture_m3u8.NativeHLSDownloader(
+            concurrency=capture_m3u8.CONFIG.get('segment_concurrency', 6),
+            retries=capture_m3u8.CONFIG.get('segment_retries', 5),
+        )
+        start = time.monotonic()
+        try:
+            await downloader.download(f"{origin.base_url}/hls/{i + 1}/master.m3u8", ts_file)
+        finally:
+            downloader.close()
+        elapsed = time.monotonic() - start
+        size = os.path.getsize(ts_file)
+        capture_m3u8.NativeHLSDownloader.discard_partial(ts_file)
+        rates.append(size / elapsed / (1024 * 1024))
+        seconds.append(elapsed)
+        print(f"   native {i + 1}: {size / (1024 * 1024):.1f} MB in {elapsed:.2f}s ({rates[-1]:.1f} MB/s)")
+    return {'runs': runs, 'seconds': summarize(seconds), 'mb_per_s': summarize(rates)}
+
+async def bench_ytdlp(origin, runs, workdir):
+    """Throughput of MasterM3U8Finder.run_ytdlp()."""
+    finder = capture_m3u8.MasterM3U8Finder()
+    ytdlp_path = finder.find_ytdlp()
+    if not ytdlp_path:
+        return {'skipped': 'yt-dlp not found'}
+    rates, seconds, failed = [], [], 0
+    for i in range(runs):
+        output = os.path.join(workdir, f"ytdlp_{i}.mkv")
+        start = time.monotonic()
+        ok = await finder.run_ytdlp(ytdlp_path, f"{origin.base_url}/hls/{i + 1}/master.m3u8", output)
+        elapsed = time.monotonic() - start
+        size = os.path.getsize(output) if os.path.exists(output) else 0
+        if not ok or not size:
+            failed += 1
+            print(f"   ytdlp {i + 1}: failed after {elapsed:.2f}s")
+            continue
+        os.remove(output)
+        rates.append(size / elapsed / (1024 * 1024))
+        seconds.append(elapsed)
+        print(f"   ytdlp {i + 1}: {size / (1024 * 1024):.1f} MB in {elapsed:.2f}s ({rates[-1]:.1f} MB/s)")
+    return {'runs': runs, 'failed': failed, 'seconds': summarize(seconds), 'mb_per_s': summarize(rates)}
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=capture_m3u8.get_base_dir(),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+def int_option(args, name, default):
+    value = capture_m3u8.pop_cli_option(args, name)
+    if value is None:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        print(f"⚠️  Ignoring invalid {name} value: {value}")
+        return default
+
+async def main():
+    args = sys.argv[1:]
+    runs = max(1, int_option(args, '--runs', 5))
+    settings = {
+        'segments': max(1, int_option(args, '--segments', 40)),
+        'segment_kb': max(1, int_option(args, '--segment-kb', 256)),
+        'latency_ms': int_option(args, '--latency-ms', 20),
+        'js_delay_ms': int_option(args, '--js-delay-ms', 1500),
+        'throttle_every': int_option(args, '--throttle-every', 0),
+    }
+    only = capture_m3u8.pop_cli_option(args, '--only')
+    stages = [s.strip() for s in (only or "capture,native,ytdlp").split(',') if s.strip()]
+    out_file = capture_m3u8.pop_cli_option(args, '--out') or "bench_results.json"
+    verbose = '--verbose' in args
+
+    config, _ = capture_m3u8.load_config()
+    # Keep the run self-contained and comparable: no learned rates, no speed caps, no side files
+    config.update({
+        'download_speed': "", 'total_download_speed': "", 'adaptive_rate': False,
+        'check_disk_space': False, 'variant_max_height': 0, 'variant_max_kbps': 0, 'variant_min_kbps': 0,
+        'log_json': "", 'run_report': "", 'session_reset_count': 0,
+    })
+    capture_m3u8.setup_interface(config_data=config)
+    if not verbose:
+        def quiet(message, level=None):
+            if level == 'error':
+                print(message, end="")
+        capture_m3u8.setup_interface(log_cb=quiet)
+
+    origin = BenchOrigin(**settings)
+    threading.Thread(target=origin.serve_forever, daemon=True).start()
+    print(f"🏁 Benchmark origin at {origin.base_url} ({runs} runs, stages: {', '.join(stages)})")
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="m3u8_bench_")
+    try:
+        if 'capture' in stages:
+            print("\n🔍 Capture (time to master URL)...")
+            results['capture'] = await bench_capture(origin, runs, workdir)
+        if 'native' in stages:
+            print("\n⬇️  Native HLS engine...")
+            results['native'] = await bench_native(origin, runs, workdir)
+        if 'ytdlp' in stages:
+            print("\n⬇️  yt-dlp...")
+            results['ytdlp'] = await bench_ytdlp(origin, runs, workdir)
+    finally:
+        origin.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': dict(settings, runs=runs,
+                         segment_concurrency=config.get('segment_concurrency'),
+                         segment_retries=config.get('segment_retries')),
+        'origin': dict(origin.counters),
+        'results': results,
+    }
+    with open(out_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {out_file}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
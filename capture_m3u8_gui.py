@@ -4,10 +4,9 @@ import queue
 import asyncio
 import json
 import os
-import time
-import random
 import re
 import ctypes
+from collections import deque
 import tkinter
 from tkinter import filedialog, messagebox, Menu
 
@@ -51,6 +50,41 @@ import capture_m3u8
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
+class AsyncRunner:
+    """
+    One asyncio event loop on a background thread for the whole GUI session.
+    - Worker threads hand coroutines to it with run() and block until they finish.
+    - Everything bound to the loop (browser pool, downloads, caches) stays alive
+      between queue items and between user actions instead of being rebuilt per asyncio.run().
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name="asyncio-loop", daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule 'coro' on the loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Run 'coro' on the loop and wait for its result (call from a worker thread, never the Tk thread)."""
+        return self.submit(coro).result()
+
+    def close(self, timeout=10):
+        """Shut the browser pool down and stop the loop."""
+        if not self.loop.is_running():
+            return
+        try:
+            self.submit(capture_m3u8.close_browser_pool()).result(timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
 class ToolTip:
     def __init__(self, widget, text):
         self.widget = widget
@@ -229,6 +263,8 @@ class M3U8DownloaderApp(ctk.CTk):
         self.input_value = None
         self.stop_event = threading.Event()
         self.bypass_dialog = False
+        # Shared event loop for every async job the GUI starts
+        self.runner = AsyncRunner()
         
         # --- CRITICAL CHANGE: Setup callbacks BEFORE loading config ---
         # This ensures 'load_config' messages are captured by the GUI log.
@@ -246,6 +282,7 @@ class M3U8DownloaderApp(ctk.CTk):
 
         # Re-apply config to the core module after loading
         capture_m3u8.setup_interface(config_data=self.config)
+        capture_m3u8.start_metrics()
 
         # Restore window position if saved
         if "window_geometry" in self.config:
@@ -332,6 +369,7 @@ class M3U8DownloaderApp(ctk.CTk):
         ctk.CTkLabel(self.opts_frame, text="Speed:").pack(side="left", padx=(20, 5))
         self.speed_opt = ctk.CTkOptionMenu(self.opts_frame, values=["Unlimited", "25M", "10M", "6.5M", "6M", "5.5M", "5M", "4.5M", "4M", "3.5M", "3M", "2.5M", "2M", "1.5M", "1M"], command=lambda _: self.save_settings())
         self.speed_opt.pack(side="left", padx=5)
+        ToolTip(self.speed_opt, "Maximum download speed per server.\nWith adaptive_rate, servers that throttle are slowed down below it.")
         
         self.progress_lbl = ctk.CTkLabel(self.opts_frame, text="Status: Idle", text_color="cyan")
         self.progress_lbl.pack(side="left", padx=15)
@@ -437,9 +475,10 @@ class M3U8DownloaderApp(ctk.CTk):
             entry_widget.delete(0, "end")
             entry_widget.insert(0, folder)
 
-    def log_callback(self, message):
+    def log_callback(self, message, level=None):
         # We don't print to console here as the core logic's log() already does it via setup_interface
-        self.log_queue.put(message)
+        # Classify here (worker thread) so the Tk thread only has to render
+        self.log_queue.put((str(message), level or capture_m3u8.log_level(message)))
 
     def clear_logs(self):
         self.log_box.configure(state="normal")
@@ -453,22 +492,37 @@ class M3U8DownloaderApp(ctk.CTk):
         return self.stop_event.is_set()
 
     def process_log_queue(self):
-        while not self.log_queue.empty():
-            msg = self.log_queue.get()
+        """
+        Renders everything logged since the last tick in one go:
+        - Only the newest log_max_lines messages of a burst are kept (ring buffer).
+        - Consecutive messages with the same level are joined into a single insert.
+        - The textbox itself is trimmed to log_max_lines lines.
+        """
+        max_lines = max(100, int(self.config.get('log_max_lines', 5000) or 5000))
+        pending = deque(maxlen=max_lines)
+        try:
+            while True:
+                pending.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if pending:
+            runs = []
+            for text, level in pending:
+                if runs and runs[-1][1] == level:
+                    runs[-1][0].append(text)
+                else:
+                    runs.append(([text], level))
+
             self.log_box.configure(state="normal")
-            
-            # Simple color mapping based on icons
-            tag = None
-            if any(x in msg for x in ["✅", "💾", "Success"]): tag = "success"
-            elif any(x in msg for x in ["❌", "FAILED", "Error"]): tag = "error"
-            elif any(x in msg for x in ["⚠️", "Warning"]): tag = "warning"
-            elif any(x in msg for x in ["🔍", "🕵️", "⚡", "📝"]): tag = "info"
-            
-            if tag:
-                self.log_box.insert("end", str(msg), tag)
-            else:
-                self.log_box.insert("end", str(msg))
-                
+            for texts, level in runs:
+                if level:
+                    self.log_box.insert("end", "".join(texts), level)
+                else:
+                    self.log_box.insert("end", "".join(texts))
+            excess = int(self.log_box.index("end-1c").split(".")[0]) - max_lines
+            if excess > 0:
+                self.log_box.delete("1.0", f"{excess + 1}.0")
             self.log_box.see("end")
             self.log_box.configure(state="disabled")
         self.after(100, self.process_log_queue)
@@ -554,7 +608,7 @@ class M3U8DownloaderApp(ctk.CTk):
 
             # Normal Single Video
             headless = self.headless_chk.get() == 1
-            asyncio.run(capture_m3u8.process_video(url, headless=headless, auto_mode=True))
+            self.runner.run(capture_m3u8.process_video(url, headless=headless, auto_mode=True))
             
         except Exception as e:
             self.log_callback(f"\n❌ Error: {e}\n")
@@ -642,55 +696,25 @@ class M3U8DownloaderApp(ctk.CTk):
             except:
                 pass
                 
-        # Global completed.log
-        script_dir = capture_m3u8.get_base_dir()
-        completed_log = os.path.join(script_dir, "completed.log")
-        completed_urls = set()
-        completed_episodes = set() # Store (season, episode) tuples
-
-        if os.path.exists(completed_log):
-            try:
-                with open(completed_log, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line: continue
-                        completed_urls.add(line)
-                        
-                        # Extract season/episode for robust matching
-                        s_match = re.search(r'[?&]season=(\d+)', line)
-                        e_match = re.search(r'[?&]episode=(\d+)', line)
-                        if s_match and e_match:
-                            completed_episodes.add((int(s_match.group(1)), int(e_match.group(1))))
-            except Exception as e:
-                self.log_callback(f"⚠️ Error reading completed.log: {e}\n")
+        # Global completion store
+        store = capture_m3u8.get_completed_store()
+        library = capture_m3u8.get_library_index()
 
         # Improved resume logging
         skipped_count = 0
+        resumed_count = 0
         for link in queue_list:
-            is_skipped = False
-            if link in completed_urls:
+            is_skipped = store.is_completed(link)
+            if is_skipped:
+                resumed_count += 1
+            elif library.find_episode_for_url(series_dir, link):
+                # File existence check
                 is_skipped = True
-            
-            if not is_skipped:
-                s_match = re.search(r'[?&]season=(\d+)', link)
-                e_match = re.search(r'[?&]episode=(\d+)', link)
-                if s_match and e_match:
-                    s_num, e_num = int(s_match.group(1)), int(e_match.group(1))
-                    if (s_num, e_num) in completed_episodes:
-                        is_skipped = True
-                    else:
-                        # File existence check
-                        season_dir_check = os.path.join(series_dir, f"Season {s_num:02d}")
-                        if os.path.exists(season_dir_check):
-                            for f_name in os.listdir(season_dir_check):
-                                if f_name.endswith(".mkv") and f"S{s_num:02d}E{e_num:02d}" in f_name:
-                                    is_skipped = True
-                                    break
             if is_skipped:
                 skipped_count += 1
 
-        if completed_urls:
-            self.log_callback(f"📂 Found resume data: {len(completed_urls)} episodes previously completed for this series.\n")
+        if resumed_count:
+            self.log_callback(f"📂 Found resume data: {resumed_count} of these episodes were previously completed.\n")
             if skipped_count > 0:
                 self.log_callback(f"   {skipped_count} of the currently selected episodes will be skipped.\n")
         
@@ -704,64 +728,15 @@ class M3U8DownloaderApp(ctk.CTk):
         # Process Queue
         headless = self.headless_chk.get() == 1
         
-        for i, link in enumerate(queue_list):
-            if self.stop_event.is_set():
-                self.log_callback("\n🛑 Batch processing stopped by user.\n")
-                break
-            
-            is_completed = False
-            skip_reason = ""
+        def on_start(item):
+            self.log_callback(f"\n--- Processing {item.index+1}/{len(queue_list)} ---\n")
+            self.after(0, lambda j=item.index+1, t=len(queue_list): (self.progress_lbl.configure(text=f"Processing file: {j}/{t}"), self.update_idletasks()))
 
-            # 1. Check log file first
-            if link in completed_urls:
-                is_completed = True
-                skip_reason = f"in completed.log"
-            else:
-                s_match = re.search(r'[?&]season=(\d+)', link)
-                e_match = re.search(r'[?&]episode=(\d+)', link)
-                if s_match and e_match:
-                    s_num, e_num = int(s_match.group(1)), int(e_match.group(1))
-                    if (s_num, e_num) in completed_episodes:
-                        is_completed = True
-                        skip_reason = f"in completed.log (S{s_num:02d}E{e_num:02d})"
-                    else:
-                        # 2. Check filesystem (self-healing)
-                        season_dir = os.path.join(series_dir, f"Season {s_num:02d}")
-                        if os.path.exists(season_dir):
-                            for f_name in os.listdir(season_dir):
-                                if f_name.endswith(".mkv") and f"S{s_num:02d}E{e_num:02d}" in f_name:
-                                    is_completed = True
-                                    skip_reason = f"file exists ({f_name})"
-                                    # Self-heal the log
-                                    try:
-                                        with open(completed_log, 'a', encoding='utf-8') as f_log:
-                                            f_log.write(f"{link}\n")
-                                        completed_urls.add(link)
-                                    except Exception as log_e:
-                                        self.log_callback(f"   ⚠️ Could not self-heal completed.log: {log_e}\n")
-                                    break
-
-            if is_completed:
-                self.log_callback(f"⏭️  Skipping ({skip_reason}): {link}\n")
-                continue
-
-            self.log_callback(f"\n--- Processing {i+1}/{len(queue_list)} ---\n")
-            self.after(0, lambda j=i+1, t=len(queue_list): (self.progress_lbl.configure(text=f"Processing file: {j}/{t}"), self.update_idletasks()))
-            success = await capture_m3u8.process_video(link, headless=headless, auto_mode=True)
-            
-            if success is True:
-                try:
-                    with open(completed_log, 'a', encoding='utf-8') as f:
-                        f.write(f"{link}\n")
-                    completed_urls.add(link)
-                except Exception as e:
-                    self.log_callback(f"⚠️ Failed to update completed.log: {e}\n")
-            
-            if i < len(queue_list) - 1:
-                wait = random.randint(self.config['min_cooldown'], self.config['max_cooldown'])
-                self.log_callback(f"⏳ Cooling down for {wait} seconds...\n")
-                capture_m3u8.report_status(f"Cooling down {wait}s...")
-                await asyncio.sleep(wait)
+        engine = capture_m3u8.QueueEngine(queue_list, library_dir=series_dir, on_start=on_start)
+        await engine.run(headless=headless)
+        engine.report_not_found()
+        if self.stop_event.is_set():
+            self.log_callback("\n🛑 Batch processing stopped by user.\n")
 
     def _ask_save_queue(self, queue_list, series_title):
         """Prompt user to optionally save the queue as a .quu file."""
@@ -865,7 +840,7 @@ class M3U8DownloaderApp(ctk.CTk):
 
     def run_top250_scrape(self):
         try:
-            results = asyncio.run(capture_m3u8.scrape_imdb_chart('movie', limit=250))
+            results = self.runner.run(capture_m3u8.scrape_imdb_chart('movie', limit=250))
             self.after(0, lambda: self.show_top250_selection(results))
         except Exception as e:
             self.log_callback(f"❌ Error scraping Top 250: {e}\n")
@@ -955,20 +930,24 @@ class M3U8DownloaderApp(ctk.CTk):
         self.log_callback(f"🚀 Starting batch download for {len(movies)} movies...\n")
         headless = self.headless_chk.get() == 1
         
+        def on_start(item):
+            self.log_callback(f"\n--- Processing {item.index+1}/{len(movies)}: {movies[item.index]['title']} ---\n")
+            self.after(0, lambda j=item.index+1, t=len(movies): (self.progress_lbl.configure(text=f"Processing file: {j}/{t}"), self.update_idletasks()))
+
+        def check_movie_file(item):
+            existing = capture_m3u8.get_library_index().find_movie(movies[item.index]['title'])
+            return f"file exists ({os.path.basename(existing)})" if existing else None
+
+        # One event loop for the whole batch so the browser pool stays warm between movies
+        async def run_items():
+            engine = capture_m3u8.QueueEngine([m['url'] for m in movies], checks=[check_movie_file], on_start=on_start)
+            await engine.run(headless=headless)
+            engine.report_not_found()
+            if self.stop_event.is_set():
+                self.log_callback("\n🛑 Batch processing stopped by user.\n")
+
         try:
-            for i, m in enumerate(movies):
-                if self.stop_event.is_set():
-                    self.log_callback("\n🛑 Batch processing stopped by user.\n")
-                    break
-                self.log_callback(f"\n--- Processing {i+1}/{len(movies)}: {m['title']} ---\n")
-                self.after(0, lambda j=i+1, t=len(movies): (self.progress_lbl.configure(text=f"Processing file: {j}/{t}"), self.update_idletasks()))
-                asyncio.run(capture_m3u8.process_video(m['url'], headless=headless, auto_mode=True))
-                
-                if i < len(movies) - 1:
-                    wait = random.randint(self.config['min_cooldown'], self.config['max_cooldown'])
-                    self.log_callback(f"⏳ Cooling down for {wait} seconds...\n")
-                    capture_m3u8.report_status(f"Cooling down {wait}s...")
-                    time.sleep(wait)
+            self.runner.run(run_items())
                     
         except Exception as e:
             self.log_callback(f"\n❌ Batch Error: {e}\n")
@@ -1044,7 +1023,7 @@ class M3U8DownloaderApp(ctk.CTk):
 
         if is_tv_queue:
             self.log_callback(f"ℹ️  Detected TV Series queue for IMDB ID: {series_imdb_id}\n")
-            meta = asyncio.run(capture_m3u8.get_imdb_info(series_imdb_id))
+            meta = self.runner.run(capture_m3u8.get_imdb_info(series_imdb_id))
             if meta and meta['type'] == 'tv':
                 finder = capture_m3u8.MasterM3U8Finder()
                 safe_title = finder.sanitize_filename(meta['title'])
@@ -1061,109 +1040,27 @@ class M3U8DownloaderApp(ctk.CTk):
         else:
             base_dir = os.path.dirname(filename)
 
-        # Global completed.log
-        script_dir = capture_m3u8.get_base_dir()
-        completed_log = os.path.join(script_dir, "completed.log")
-        
-        completed_urls = set()
-        completed_episodes = set()
-        completed_movies = set()
-        
-        if os.path.exists(completed_log):
-            try:
-                with open(completed_log, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if not line: continue
-                        completed_urls.add(line)
-                        
-                        imdb_m = re.search(r'(tt\d{7,})', line)
-                        s_match = re.search(r'[?&]season=(\d+)', line)
-                        e_match = re.search(r'[?&]episode=(\d+)', line)
-                        
-                        if imdb_m:
-                            imdb_id = imdb_m.group(1)
-                            if s_match and e_match:
-                                # TV Episode
-                                completed_episodes.add((imdb_id, int(s_match.group(1)), int(e_match.group(1))))
-                            else:
-                                # Movie
-                                completed_movies.add(imdb_id)
-                self.log_callback(f"📂 Found resume log with {len(completed_urls)} entries.\n")
-            except Exception as e:
-                self.log_callback(f"⚠️ Error reading completed.log: {e}\n")
+        # Global completion store
+        completed_count = capture_m3u8.get_completed_store().count()
+        if completed_count:
+            self.log_callback(f"📂 Found resume data with {completed_count} entries.\n")
 
         headless = self.headless_chk.get() == 1
-        
-        try:
-            for i, url in enumerate(urls):
-                if self.stop_event.is_set():
-                    self.log_callback("\n🛑 Queue processing stopped by user.\n")
-                    break
-                
-                is_completed = False
-                skip_reason = ""
 
-                if url in completed_urls:
-                    is_completed = True
-                    skip_reason = "in completed.log"
-                else:
-                    # Robust check using IMDB ID
-                    curr_imdb_m = re.search(r'(tt\d{7,})', url)
-                    curr_s_match = re.search(r'[?&]season=(\d+)', url)
-                    curr_e_match = re.search(r'[?&]episode=(\d+)', url)
-                    
-                    if curr_imdb_m:
-                        imdb_id = curr_imdb_m.group(1)
-                        if curr_s_match and curr_e_match:
-                            s_num, e_num = int(curr_s_match.group(1)), int(curr_e_match.group(1))
-                            if (imdb_id, s_num, e_num) in completed_episodes:
-                                is_completed = True
-                                skip_reason = f"in completed.log (Identified S{s_num:02d}E{e_num:02d})"
-                        elif imdb_id in completed_movies:
-                            is_completed = True
-                            skip_reason = f"in completed.log (Movie IMDB: {imdb_id})"
-
-                if not is_completed and is_tv_queue and series_dir:
-                    s_match = re.search(r'[?&]season=(\d+)', url)
-                    e_match = re.search(r'[?&]episode=(\d+)', url)
-                    if s_match and e_match:
-                        s_num, e_num = int(s_match.group(1)), int(e_match.group(1))
-                        season_dir_check = os.path.join(series_dir, f"Season {s_num:02d}")
-                        if os.path.exists(season_dir_check):
-                            for f_name in os.listdir(season_dir_check):
-                                if f_name.endswith(".mkv") and f"S{s_num:02d}E{e_num:02d}" in f_name:
-                                    is_completed = True
-                                    skip_reason = f"file exists ({f_name})"
-                                    try:
-                                        with open(completed_log, 'a', encoding='utf-8') as f_log:
-                                            f_log.write(f"{url}\n")
-                                        completed_urls.add(url)
-                                    except: pass
-                                    break
-                
-                if is_completed:
-                    self.log_callback(f"⏭️  Skipping ({skip_reason}): {url}\n")
-                    continue
-                self.log_callback(f"\n--- Processing {i+1}/{len(urls)} ---\n")
-                self.after(0, lambda j=i+1, t=len(urls): (self.progress_lbl.configure(text=f"Processing file: {j}/{t}"), self.update_idletasks()))
-                
-                success = asyncio.run(capture_m3u8.process_video(url, headless=headless, auto_mode=True))
-                
-                if success is True:
-                    try:
-                        with open(completed_log, 'a', encoding='utf-8') as f:
-                            f.write(f"{url}\n")
-                        completed_urls.add(url)
-                    except Exception as e:
-                        self.log_callback(f"⚠️ Failed to update completed.log: {e}\n")
-                
-                if i < len(urls) - 1:
-                    wait = random.randint(self.config['min_cooldown'], self.config['max_cooldown'])
-                    self.log_callback(f"⏳ Cooling down for {wait} seconds...\n")
-                    capture_m3u8.report_status(f"Cooling down {wait}s...")
-                    # Interruptible sleep
-                    self.stop_event.wait(wait)
+        def on_start(item):
+            self.log_callback(f"\n--- Processing {item.index+1}/{len(urls)} ---\n")
+            self.after(0, lambda j=item.index+1, t=len(urls): (self.progress_lbl.configure(text=f"Processing file: {j}/{t}"), self.update_idletasks()))
+
+        # Runs on the shared loop, so the browser pool stays warm between items and batches
+        async def run_items():
+            engine = capture_m3u8.QueueEngine(urls, library_dir=base_dir, on_start=on_start)
+            await engine.run(headless=headless)
+            engine.report_not_found()
+            if self.stop_event.is_set():
+                self.log_callback("\n🛑 Queue processing stopped by user.\n")
+
+        try:
+            self.runner.run(run_items())
                     
         except Exception as e:
             self.log_callback(f"\n❌ Queue Error: {e}\n")
@@ -1182,8 +1079,10 @@ class M3U8DownloaderApp(ctk.CTk):
         if self.is_running:
             if messagebox.askokcancel("Quit", "A download is in progress. Do you want to stop and quit?"):
                 self.stop_process()
+                self.runner.close(timeout=5)
                 self.destroy()
         else:
+            self.runner.close()
             self.destroy()
 
     def check_availability(self):
@@ -1203,7 +1102,7 @@ class M3U8DownloaderApp(ctk.CTk):
         def run_check():
             try:
                 # 1. Determine if Movie or TV Show
-                meta = asyncio.run(capture_m3u8.get_imdb_info(imdb_id))
+                meta = self.runner.run(capture_m3u8.get_imdb_info(imdb_id))
                 
                 if meta and meta['type'] == 'tv':
                     # It's a TV Show. Check S01E01 availability
@@ -1254,7 +1153,7 @@ class M3U8DownloaderApp(ctk.CTk):
 
     def run_search(self, query, filter_type='all'):
         try:
-            results = asyncio.run(capture_m3u8.search_imdb(query, filter_type))
+            results = self.runner.run(capture_m3u8.search_imdb(query, filter_type))
 
             self.after(0, lambda: self.show_search_results(results))
         except Exception as e:
@@ -1331,7 +1230,7 @@ class M3U8DownloaderApp(ctk.CTk):
         imdb_id = match.group(1)
         
         try:
-            meta = asyncio.run(capture_m3u8.get_imdb_info(imdb_id))
+            meta = self.runner.run(capture_m3u8.get_imdb_info(imdb_id))
             if not meta:
                 return
                 
@@ -1406,7 +1305,7 @@ class M3U8DownloaderApp(ctk.CTk):
                         q.append(link)
                 return q
             
-            queue_list = asyncio.run(fetch_all())
+            queue_list = self.runner.run(fetch_all())
             
             if not queue_list:
                 self.log_callback("❌ Failed to build queue.\n")
@@ -0,0 +1,148 @@
+import re
+import urllib.parse
+
+# Minimal HLS (RFC 8216) playlist model used by capture_m3u8.py:
+# - parse_master() / parse_media() turn playlist text into small slotted objects.
+# - select_variant() applies the variant policy from config.json.
+
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+def parse_attributes(text):
+    """Parse an attribute list like 'BANDWIDTH=800000,RESOLUTION=1280x720,CODECS="a,b"'."""
+    return {key: value.strip('"') for key, value in ATTRIBUTE_RE.findall(text)}
+
+def is_playlist(text):
+    return text.lstrip('\ufeff').lstrip().startswith('#EXTM3U')
+
+class Variant:
+    """One #EXT-X-STREAM-INF entry: a media playlist at a given quality."""
+    __slots__ = ('uri', 'bandwidth', 'average_bandwidth', 'width', 'height', 'codecs', 'frame_rate', 'audio', 'subtitles')
+
+    def __init__(self, uri, attrs):
+        self.uri = uri
+        self.bandwidth = int(attrs.get('BANDWIDTH', 0) or 0)
+        self.average_bandwidth = int(attrs.get('AVERAGE-BANDWIDTH', 0) or 0)
+        self.width, self.height = 0, 0
+        match = re.match(r'(\d+)x(\d+)', attrs.get('RESOLUTION', ''))
+        if match:
+            self.width, self.height = int(match.group(1)), int(match.group(2))
+        self.codecs = attrs.get('CODECS')
+        self.frame_rate = float(attrs.get('FRAME-RATE', 0) or 0)
+        self.audio = attrs.get('AUDIO')
+        self.subtitles = attrs.get('SUBTITLES')
+
+    @property
+    def resolution(self):
+        return f"{self.width}x{self.height}" if self.height else "?"
+
+    def __repr__(self):
+        return f"Variant({self.resolution} @ {self.bandwidth // 1000} kbps)"
+
+class Media:
+    """One #EXT-X-MEDIA rendition (alternate audio, subtitles...)."""
+    __slots__ = ('type', 'group_id', 'name', 'language', 'uri', 'default')
+
+    def __init__(self, attrs, base_url):
+        self.type = attrs.get('TYPE')
+        self.group_id = attrs.get('GROUP-ID')
+        self.name = attrs.get('NAME')
+        self.language = attrs.get('LANGUAGE')
+        self.uri = urllib.parse.urljoin(base_url, attrs['URI']) if attrs.get('URI') else None
+        self.default = attrs.get('DEFAULT') == 'YES'
+
+class Segment:
+    __slots__ = ('uri', 'duration')
+
+    def __init__(self, uri, duration):
+        self.uri = uri
+        self.duration = duration
+
+class MasterPlaylist:
+    __slots__ = ('url', 'variants', 'media')
+
+    def __init__(self, url, variants, media):
+        self.url = url
+        self.variants = variants
+        self.media = media
+
+    def renditions(self, media_type, group_id):
+        return [m for m in self.media if m.type == media_type and m.group_id == group_id]
+
+    def has_separate_audio(self, variant):
+        """True if the variant's audio lives in its own playlist (needs a second download + mux)."""
+        return bool(variant.audio) and any(m.uri for m in self.renditions('AUDIO', variant.audio))
+
+class MediaPlaylist:
+    __slots__ = ('url', 'segments', 'init_uri', 'key_method', 'byte_ranges')
+
+    def __init__(self, url):
+        self.url = url
+        self.segments = []
+        self.init_uri = None
+        self.key_method = None
+        self.byte_ranges = False
+
+    @property
+    def duration(self):
+        return sum(s.duration for s in self.segments)
+
+def parse_master(text, base_url):
+    """Variants and renditions of a master playlist (no variants if 'text' is a media playlist)."""
+    variants, media = [], []
+    lines = [l.strip() for l in text.splitlines()]
+    for i, line in enumerate(lines):
+        if line.startswith('#EXT-X-MEDIA:'):
+            media.append(Media(parse_attributes(line.split(':', 1)[1]), base_url))
+        elif line.startswith('#EXT-X-STREAM-INF:'):
+            uri = next((l for l in lines[i + 1:] if l and not l.startswith('#')), None)
+            if uri:
+                variants.append(Variant(urllib.parse.urljoin(base_url, uri), parse_attributes(line.split(':', 1)[1])))
+    return MasterPlaylist(base_url, variants, media)
+
+def parse_media(text, base_url):
+    """Segments of a media playlist, plus the features the native engine has to refuse."""
+    playlist = MediaPlaylist(base_url)
+    pending_duration = None
+    for line in (l.strip() for l in text.splitlines()):
+        if not line:
+            continue
+        if line.startswith('#EXT-X-KEY:'):
+            method = parse_attributes(line.split(':', 1)[1]).get('METHOD', 'NONE')
+            if method != 'NONE':
+                playlist.key_method = method
+        elif line.startswith('#EXT-X-BYTERANGE'):
+            playlist.byte_ranges = True
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = parse_attributes(line.split(':', 1)[1]).get('URI')
+            if uri:
+                playlist.init_uri = urllib.parse.urljoin(base_url, uri)
+        elif line.startswith('#EXTINF:'):
+            try:
+                pending_duration = float(line[8:].split(',', 1)[0])
+            except ValueError:
+                pending_duration = 0.0
+        elif not line.startswith('#'):
+            playlist.segments.append(Segment(urllib.parse.urljoin(base_url, line), pending_duration or 0.0))
+            pending_duration = None
+    return playlist
+
+def select_variant(variants, max_height=0, max_kbps=0, min_kbps=0):
+    """
+    Picks a variant according to the policy (0 = no limit):
+    - Variants taller than max_height or above max_kbps are ruled out.
+    - With min_kbps, the lowest remaining variant that reaches it wins
+      (or the best one if none does); otherwise the highest bitrate wins.
+    - If the limits rule out everything, the smallest variant is used.
+    """
+    if not variants:
+        return None
+    eligible = [v for v in variants
+                if (not max_height or not v.height or v.height <= max_height)
+                and (not max_kbps or v.bandwidth <= max_kbps * 1000)]
+    if not eligible:
+        return min(variants, key=lambda v: (v.height or 0, v.bandwidth))
+    if min_kbps:
+        enough = [v for v in eligible if v.bandwidth >= min_kbps * 1000]
+        if enough:
+            return min(enough, key=lambda v: v.bandwidth)
+    return max(eligible, key=lambda v: v.bandwidth)
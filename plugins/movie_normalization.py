@@ -1,4 +1,5 @@
 import os
+import shutil
 import subprocess
 import re
 
@@ -7,6 +8,11 @@ import re
 # Otherwise, use full path: r"C:\Tools\ffmpeg\bin\ffmpeg.exe"
 FFMPEG_BINARY = "ffmpeg"
 
+# Peak disk usage as a multiple of the input: the _DualAudio copy is written
+# next to the original before the original is deleted.
+# capture_m3u8.py reads this to reserve space before the download starts.
+DISK_SPACE_FACTOR = 2.0
+
 def process(file_path):
     """
     Upmixes audio to 5.1 surround sound (Dual Audio: Normalized & Direct) using FFmpeg.
@@ -34,6 +40,16 @@ def process(file_path):
     except:
         pass
 
+    # 1.7 Check free space for the second copy (with 5% headroom for the re-encoded audio)
+    try:
+        needed = int(os.path.getsize(file_path) * (DISK_SPACE_FACTOR - 1) * 1.05)
+        free = shutil.disk_usage(os.path.dirname(os.path.abspath(file_path))).free
+        if free < needed:
+            print(f"   ⚠️ Not enough disk space for the upmixed copy ({needed // (1024*1024)} MB needed, {free // (1024*1024)} MB free). Skipping.")
+            return file_path
+    except OSError:
+        pass
+
     # 2. Generate output filename
     # Example: "Movie.mkv" -> "Movie_DualAudio.mkv"
     base_name, extension = os.path.splitext(file_path)